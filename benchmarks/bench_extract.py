@@ -0,0 +1,76 @@
+"""
+Compares the HTML extractor backends on saved ticket and listing pages.
+
+Usage:
+    python benchmarks/bench_extract.py [--pages DIR] [--repeat N]
+
+Every backend's output is checked against the BeautifulSoup reference before it is timed.
+"""
+
+import argparse
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from extract import BACKENDS, extract_ticket, extract_ticket_hrefs  # noqa: E402
+
+FIXTURES = pathlib.Path(__file__).resolve().parent / 'fixtures'
+
+
+def load_pages(pages_dir):
+    """
+    Loads the saved pages to benchmark. Listing pages are recognised by their file name.
+    """
+
+    tickets, listings = [], []
+
+    for path in sorted(pathlib.Path(pages_dir).glob('*.html')):
+        content = path.read_bytes()
+        (listings if 'listing' in path.name else tickets).append(content)
+
+    return tickets, listings
+
+
+def time_backend(backend, tickets, listings, repeat):
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        for content in tickets:
+            extract_ticket(content, backend)
+        for content in listings:
+            extract_ticket_hrefs(content, backend)
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', default=FIXTURES, help='directory of saved .html pages')
+    parser.add_argument('--repeat', type=int, default=200, help='passes over the pages per backend')
+    args = parser.parse_args()
+
+    tickets, listings = load_pages(args.pages)
+    pages = (len(tickets) + len(listings)) * args.repeat
+
+    expected_tickets = [extract_ticket(content, 'bs4') for content in tickets]
+    expected_hrefs = [extract_ticket_hrefs(content, 'bs4') for content in listings]
+
+    baseline = None
+    print(f'{"backend":<8}{"pages/s":>12}{"ms/page":>10}{"speedup":>10}')
+
+    for backend in ['bs4'] + [name for name in BACKENDS if name != 'bs4']:
+        if [extract_ticket(content, backend) for content in tickets] != expected_tickets or \
+                [extract_ticket_hrefs(content, backend) for content in listings] != expected_hrefs:
+            print(f'{backend:<8}  output differs from bs4, skipped')
+            continue
+
+        elapsed = time_backend(backend, tickets, listings, args.repeat)
+        baseline = baseline or elapsed
+
+        print(f'{backend:<8}{pages / elapsed:>12.0f}{elapsed / pages * 1000:>10.3f}{baseline / elapsed:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""
+Offline end-to-end benchmark of the scrape, stats and image jobs.
+
+A synthetic corpus of listing pages, ticket pages and ticket images is built from the saved fixture pages and served
+by a local HTTP server. Inserts and stats run against a throwaway SQLite database. Each stage is timed at every
+requested size and the results are written as JSON.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--games 100 1000 10000] [--snapshots 365] [--output results.json]
+                                        [--compare baseline.json] [--tolerance 0.25]
+
+The Selenium scraper needs Chrome and is not covered. Its page-processing stages are the same as the HTTP scraper's.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import pathlib
+import platform
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import unquote
+
+# Keep the jobs' module level logging config from creating log files in the working directory
+logging.basicConfig(level=logging.WARNING)
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import pandas as pd  # noqa: E402
+from PIL import Image  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+import fetch  # noqa: E402
+import img_download  # noqa: E402
+import read_cache  # noqa: E402
+import ticket_scrape  # noqa: E402
+import ticket_scrape_old  # noqa: E402
+import ticket_stats  # noqa: E402
+
+FIXTURES = pathlib.Path(__file__).resolve().parent / 'fixtures'
+
+PRICES = [1, 2, 3, 5, 10, 20, 30, 50]
+
+# Number of distinct ticket images, the rest are duplicates so the image sync's dedupe is exercised
+IMAGE_VARIANTS = 32
+
+SCHEMA = [
+    'CREATE TABLE ticket (ticket_number INT, name TEXT, price INT, odds REAL, pic TEXT)',
+    'CREATE TABLE prize (prize_id INTEGER PRIMARY KEY, ticket_number INT, prize TEXT, time TEXT)',
+    'CREATE TABLE prize_stats (prize_id INT, total_prizes_rem INT, top_prizes_rem INT, ev_raw REAL, ev_score REAL)',
+]
+
+
+def build_corpus(games, seed=0):
+    """
+    Builds a listing page, one ticket page per game and the ticket images from the fixture pages.
+
+    Args:
+        games: Number of games listed.
+        seed: Seed of the random prize counts.
+
+    Returns:
+        A dictionary of url path to (content type, body).
+
+    """
+
+    rng = random.Random(seed)
+    ticket_template = (FIXTURES / 'ticket.html').read_text()
+    listing_template = (FIXTURES / 'listing.html').read_text()
+
+    items = re.search(r'(\s*<li class="igLandListItem">.*?</li>)', listing_template, re.S).group(1)
+    corpus = {}
+    listing_items = []
+
+    for game in range(games):
+        number = 1000 + game
+        price = PRICES[game % len(PRICES)]
+        slug = f'Fixture-Game-{number}'
+
+        listing_items.append(items.replace('$1-Games', f'${price}-Games')
+                             .replace('Fixture-Game-1000', slug).replace('1000', str(number)))
+
+        page = ticket_template.replace('Fixture Fortune', f'Fixture Game {number}').replace('1234', str(number))
+        page = re.sub(r'(<td class="tpdRemainCell">)[\d,]+', lambda m: f'{m.group(1)}{rng.randint(0, 500000):,}', page)
+        corpus[f'/Games/ScratchOffs/${price}-Games/{slug}'] = ('text/html', page.encode())
+
+    listing = re.sub(r'\s*<li class="igLandListItem">.*?</li>', '', listing_template, flags=re.S)
+    listing = listing.replace('<ul class="igLandList">', '<ul class="igLandList">' + ''.join(listing_items))
+    corpus['/games/scratch-offs'] = ('text/html', listing.encode())
+
+    variants = []
+    for variant in range(IMAGE_VARIANTS):
+        buffer = BytesIO()
+        Image.new('RGB', (300, 450), (variant * 7 % 256, 90, 160)).save(buffer, format='JPEG')
+        variants.append(buffer.getvalue())
+
+    for game in range(games):
+        corpus[f'/static/img/tickets/{1000 + game}.jpg'] = ('image/jpeg', variants[game % IMAGE_VARIANTS])
+
+    return corpus
+
+
+def serve(corpus):
+    """
+    Serves the corpus from a local HTTP server on a free port.
+
+    Returns:
+        The running server, its base url is http://127.0.0.1:<server.server_port>.
+
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            path = re.sub('/+', '/', unquote(self.path))
+
+            if path not in corpus:
+                self.send_error(404)
+                return
+
+            content_type, body = corpus[path]
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def timed(results, stage, items, func, *args, **kwargs):
+    """
+    Runs one stage and records its time and throughput.
+    """
+
+    start = time.perf_counter()
+    value = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    results[stage] = {'seconds': round(seconds, 4), 'items': items, 'items_per_sec': round(items / seconds, 1)}
+    print(f'  {stage:<12}{items:>10} items{seconds:>10.3f}s{items / seconds:>12.1f}/s')
+
+    return value
+
+
+def synthetic_snapshots(df, snapshots, seed=0):
+    """
+    Builds a prize history of one snapshot per day per game, with prizes being claimed over time.
+
+    Args:
+        df: DataFrame of scraped tickets.
+        snapshots: Number of daily snapshots per game.
+        seed: Seed of the random claims.
+
+    Returns:
+        A DataFrame with ticket_number, prize and time columns.
+
+    """
+
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    rows = []
+
+    for ticket_number, prize in zip(df['ticket_number'], df['prize']):
+        remaining = {tier: int(rem.replace(',', '')) for tier, rem in json.loads(prize).items()}
+
+        for day in range(snapshots):
+            remaining = {tier: max(0, rem - rng.randint(0, 3)) for tier, rem in remaining.items()}
+            rows.append([ticket_number, json.dumps({tier: f'{rem:,}' for tier, rem in remaining.items()}),
+                         (start + timedelta(days=day)).strftime('%Y-%m-%d %H:%M:%S')])
+
+    return pd.DataFrame(rows, columns=['ticket_number', 'prize', 'time'])
+
+
+def run_size(games, snapshots, workdir):
+    """
+    Runs every stage for one corpus size.
+
+    Returns:
+        A dictionary of stage name to its time and throughput.
+
+    """
+
+    results = {}
+    corpus = build_corpus(games)
+    server = serve(corpus)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    ticket_scrape_old.BASE_URL = base_url
+
+    try:
+        print(f'{games} games, {snapshots} snapshots per game')
+
+        listing = corpus['/games/scratch-offs'][1]
+        urls = [f'{base_url}/{href}' for href in ticket_scrape_old.extract_ticket_hrefs(listing)]
+
+        pages = timed(results, 'fetch', len(urls), asyncio.run,
+                      fetch.fetch_pages(urls, concurrency=32, per_host=32, rate=None))
+
+        data = timed(results, 'parse', len(pages),
+                     lambda: [ticket_scrape_old.parse_ticket(content, url) for url, content in pages])
+        df = pd.DataFrame(data, columns=['name', 'ticket_number', 'price', 'odds', 'prize', 'pic', 'time'])
+
+        db_path = os.path.join(workdir, f'bench_{games}.db')
+        conn = sqlite3.connect(db_path)
+        for statement in SCHEMA:
+            conn.execute(statement)
+
+        history = synthetic_snapshots(df, snapshots)
+
+        def insert():
+            ticket_scrape.insert_df(df[['ticket_number', 'name', 'price', 'odds', 'pic']], 'ticket',
+                                    conn=conn, placeholder='?')
+            ticket_scrape.insert_df(history, 'prize', chunk_size=5000, conn=conn, placeholder='?')
+
+        timed(results, 'insert', len(df) + len(history), insert)
+        conn.close()
+
+        sql_engine = create_engine(f'sqlite:///{db_path}')
+
+        # Keep the stats job's cache invalidation inside the throwaway directory
+        read_cache.VERSION_PATH = os.path.join(workdir, 'stats_version')
+
+        timed(results, 'stats', len(history), ticket_stats.update_stats, sql_engine)
+        sql_engine.dispose()
+
+        img_dir = os.path.join(workdir, f'img_{games}') + '/'
+        os.makedirs(img_dir)
+        img_download.IMG_DIR = img_dir
+        img_df = df[['pic', 'price', 'ticket_number']].copy()
+
+        timed(results, 'image_sync', len(img_df), img_download.download_img, img_df, 16, {}, set())
+
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Lists the stages whose throughput dropped by more than tolerance compared with a baseline run.
+    """
+
+    regressions = []
+
+    for games, stages in results['sizes'].items():
+        for stage, result in stages.items():
+            expected = baseline.get('sizes', {}).get(games, {}).get(stage)
+
+            if expected and result['items_per_sec'] < expected['items_per_sec'] * (1 - tolerance):
+                regressions.append(f'{games} games {stage}: {result["items_per_sec"]}/s, '
+                                   f'baseline {expected["items_per_sec"]}/s')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, nargs='+', default=[100, 1000], help='corpus sizes to run')
+    parser.add_argument('--snapshots', type=int, default=30, help='daily prize snapshots per game')
+    parser.add_argument('--output', default='bench_results.json', help='JSON file the results are written to')
+    parser.add_argument('--compare', help='baseline results JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed throughput drop before failing')
+    args = parser.parse_args()
+
+    results = {
+        'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'snapshots': args.snapshots,
+        'sizes': {},
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for games in args.games:
+            results['sizes'][str(games)] = run_size(games, args.snapshots, workdir)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    print(f'Results written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
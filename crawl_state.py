@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+# Progress is only resumed within the same window, one per day by default
+WINDOW_FORMAT = '%Y-%m-%d'
+
+
+class CrawlCheckpoint:
+    """
+    On-disk record of a crawl's progress, so an interrupted crawl resumes where it stopped.
+
+    Tickets whose data was collected are skipped by a restarted crawl in the same window and tickets that failed are
+    retried first. Once a crawl finishes a full pass the next one scrapes every ticket again, so only the failures are
+    kept, and the file is removed if there were none.
+
+    Args:
+        path: The JSON file the progress is stored in.
+        window: Key of the current window, today's date if not given.
+        fresh: Whether to discard any saved progress and start a clean crawl.
+
+    """
+
+    def __init__(self, path='crawl_state.json', window=None, fresh=False):
+        self.path = path
+        self.window = window or datetime.now().strftime(WINDOW_FORMAT)
+        self.done = {}
+        self.failed = set()
+        self._lock = threading.Lock()
+
+        if fresh:
+            self.clear()
+
+        elif os.path.exists(path):
+            try:
+                with open(path) as file:
+                    state = json.load(file)
+            except (OSError, ValueError) as e:
+                logging.error(f'Unable to read crawl state {path}, starting a clean crawl.\n{e}')
+                state = {}
+
+            if state.get('window') == self.window:
+                self.done = state.get('done', {})
+                self.failed = set(state.get('failed', []))
+                logging.info(f'Resuming crawl: {len(self.done)} tickets done, {len(self.failed)} failed.')
+            elif state:
+                logging.info(f"Crawl state is from window {state.get('window')}, starting a clean crawl.")
+
+    def pending(self, hrefs):
+        """
+        Gets the hrefs that still have to be scraped, the ones that failed last time first.
+
+        Args:
+            hrefs: Every href in the crawl.
+
+        Returns:
+            A list of hrefs.
+
+        """
+
+        with self._lock:
+            hrefs = [href for href in hrefs if href not in self.done]
+
+            return [href for href in hrefs if href in self.failed] + [href for href in hrefs if href not in self.failed]
+
+    def mark_done(self, batch):
+        """
+        Records tickets whose data was collected.
+
+        Args:
+            batch: List of (href, ticket data) tuples.
+
+        """
+
+        with self._lock:
+            for href, ticket_data in batch:
+                self.done[href] = ticket_data
+                self.failed.discard(href)
+
+    def mark_failed(self, href):
+        with self._lock:
+            self.failed.add(href)
+
+    def save(self):
+        """
+        Writes the progress to disk, replacing the previous file atomically.
+        """
+
+        with self._lock:
+            state = {'window': self.window, 'done': self.done, 'failed': sorted(self.failed)}
+            tmp_path = f'{self.path}.tmp'
+
+            with open(tmp_path, 'w') as file:
+                json.dump(state, file)
+
+            os.replace(tmp_path, self.path)
+
+    def finish(self):
+        """
+        Ends a full pass of the crawl, once its tickets are stored. Only the failures are kept, so the next run
+        scrapes every ticket again with those first instead of retrying just the failures.
+        """
+
+        if self.failed:
+            with self._lock:
+                self.done = {}
+
+            self.save()
+            logging.info(f'Crawl finished with {len(self.failed)} failures, the next run tries them first.')
+        else:
+            self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.done = {}
+            self.failed = set()
+
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
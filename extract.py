@@ -0,0 +1,249 @@
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import html as lxml_html
+except ImportError:
+    lxml_html = None
+
+# Elements that never have a closing tag
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+
+def empty_ticket():
+    return {
+        'name': None,
+        'number': None,
+        'odds': None,
+        'tiers': [],
+        'remaining': [],
+        'pic_style': None,
+    }
+
+
+def bs4_ticket(content):
+    """
+    Extracts the ticket fields by building a full BeautifulSoup tree. Kept as the reference implementation.
+    """
+
+    page = BeautifulSoup(content, 'html.parser')
+    ticket = empty_ticket()
+
+    h1 = page.find('h1')
+    number = page.find('span', {'class': 'number'})
+    odds = page.find(class_='odds')
+    pic = page.find(class_='igTicketImg')
+
+    ticket['name'] = h1.text if h1 else None
+    ticket['number'] = number.text if number else None
+    ticket['odds'] = odds.text if odds else None
+    ticket['pic_style'] = pic.get('style') if pic else None
+
+    for cell in page.find_all(True, {'class': ['tpdPrizeCell', 'tpdRemainCell']}):
+        if 'tpdPrizeCell' in cell['class']:
+            ticket['tiers'].append(cell.text.strip())
+        else:
+            ticket['remaining'].append(cell.text.strip())
+
+    return ticket
+
+
+def bs4_hrefs(content):
+    page = BeautifulSoup(content, 'html.parser')
+    hrefs = []
+
+    for item in page.find_all(class_='igLandListItem'):
+        a_tag = item.find('a')
+        if a_tag is not None:
+            hrefs.append(a_tag.get('href'))
+
+    return hrefs
+
+
+def has_class(class_name):
+    return f'contains(concat(" ", normalize-space(@class), " "), " {class_name} ")'
+
+
+def lxml_ticket(content):
+    """
+    Extracts the ticket fields with lxml's C parser and XPath.
+    """
+
+    page = lxml_html.fromstring(content)
+    ticket = empty_ticket()
+
+    h1 = page.xpath('(//h1)[1]')
+    number = page.xpath(f'(//span[{has_class("number")}])[1]')
+    odds = page.xpath(f'(//*[{has_class("odds")}])[1]')
+    pic = page.xpath(f'(//*[{has_class("igTicketImg")}])[1]')
+
+    ticket['name'] = h1[0].text_content() if h1 else None
+    ticket['number'] = number[0].text_content() if number else None
+    ticket['odds'] = odds[0].text_content() if odds else None
+    ticket['pic_style'] = pic[0].get('style') if pic else None
+
+    for cell in page.xpath(f'//*[{has_class("tpdPrizeCell")} or {has_class("tpdRemainCell")}]'):
+        if 'tpdPrizeCell' in cell.get('class').split():
+            ticket['tiers'].append(cell.text_content().strip())
+        else:
+            ticket['remaining'].append(cell.text_content().strip())
+
+    return ticket
+
+
+def lxml_hrefs(content):
+    page = lxml_html.fromstring(content)
+    hrefs = []
+
+    for item in page.xpath(f'//*[{has_class("igLandListItem")}]'):
+        a_tag = item.xpath('(.//a)[1]')
+        if a_tag:
+            hrefs.append(a_tag[0].get('href'))
+
+    return hrefs
+
+
+class TagScanner(HTMLParser):
+    """
+    Streams through a page once and keeps only the text and attributes of the elements the scrapers use,
+    without building a tree.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.ticket = empty_ticket()
+        self.hrefs = []
+        self.depth = 0
+        self.field = None           # field whose text is being collected
+        self.field_depth = None     # depth at which the collected element closes
+        self.text = []
+        self.list_item_depth = None  # depth at which the current igLandListItem closes
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+
+        if self.list_item_depth is not None and tag == 'a':
+            self.hrefs.append(attrs.get('href'))
+            self.list_item_depth = None
+
+        if 'igLandListItem' in classes and tag not in VOID_TAGS:
+            self.list_item_depth = self.depth
+
+        if 'igTicketImg' in classes and self.ticket['pic_style'] is None:
+            self.ticket['pic_style'] = attrs.get('style')
+
+        if tag in VOID_TAGS:
+            return
+
+        if self.field is None:
+            if tag == 'h1' and self.ticket['name'] is None:
+                self.field = 'name'
+            elif tag == 'span' and 'number' in classes and self.ticket['number'] is None:
+                self.field = 'number'
+            elif 'odds' in classes and self.ticket['odds'] is None:
+                self.field = 'odds'
+            elif 'tpdPrizeCell' in classes:
+                self.field = 'tiers'
+            elif 'tpdRemainCell' in classes:
+                self.field = 'remaining'
+
+            if self.field is not None:
+                self.field_depth = self.depth
+                self.text = []
+
+        self.depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        # Self-closing tags have no content, only their attributes matter
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.depth -= 1
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+
+        self.depth -= 1
+
+        if self.list_item_depth is not None and self.depth <= self.list_item_depth:
+            self.list_item_depth = None
+
+        if self.field is not None and self.depth <= self.field_depth:
+            text = ''.join(self.text)
+
+            if self.field in ('tiers', 'remaining'):
+                self.ticket[self.field].append(text.strip())
+            else:
+                self.ticket[self.field] = text
+
+            self.field = None
+            self.field_depth = None
+
+    def handle_data(self, data):
+        if self.field is not None:
+            self.text.append(data)
+
+
+def scan_ticket(content):
+    """
+    Extracts the ticket fields with a single streaming pass over the page.
+    """
+
+    scanner = TagScanner()
+    scanner.feed(content.decode() if isinstance(content, bytes) else content)
+    scanner.close()
+
+    return scanner.ticket
+
+
+def scan_hrefs(content):
+    scanner = TagScanner()
+    scanner.feed(content.decode() if isinstance(content, bytes) else content)
+    scanner.close()
+
+    return scanner.hrefs
+
+
+BACKENDS = {
+    'bs4': (bs4_ticket, bs4_hrefs),
+    'scan': (scan_ticket, scan_hrefs),
+}
+
+if lxml_html is not None:
+    BACKENDS['lxml'] = (lxml_ticket, lxml_hrefs)
+
+DEFAULT_BACKEND = 'lxml' if lxml_html is not None else 'scan'
+
+
+def extract_ticket(content, backend=DEFAULT_BACKEND):
+    """
+    Extracts the fields the scrapers use from a ticket's page.
+
+    Args:
+        content: The HTML of the ticket's page.
+        backend: Name of the extractor backend ('lxml', 'scan' or 'bs4').
+
+    Returns:
+        A dictionary with the raw text of the name, number and odds, the style attribute of the ticket image,
+        and lists of the prize tiers and prizes remaining.
+
+    """
+
+    return BACKENDS[backend][0](content)
+
+
+def extract_ticket_hrefs(content, backend=DEFAULT_BACKEND):
+    """
+    Extracts the href of every ticket from the scratch off listing page.
+
+    Args:
+        content: The HTML of the listing page.
+        backend: Name of the extractor backend ('lxml', 'scan' or 'bs4').
+
+    Returns:
+        A list of hrefs for every available ticket.
+
+    """
+
+    return BACKENDS[backend][1](content)
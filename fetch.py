@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+import aiohttp
+import metrics
+from throttle import THROTTLE_STATUSES, AdaptiveLimiter, TokenBucket, backoff_delay, parse_retry_after
+
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+# Returned in place of a body when the server answers a conditional request with 304
+NOT_MODIFIED = b''
+
+
+async def fetch_page(session, url, bucket, limiter, cache=None, retries=3):
+    """
+    Downloads a single page, backing off and retrying when the site throttles or fails the request.
+
+    Args:
+        session: The aiohttp session whose connection pool is used.
+        url: The url of the page.
+        bucket: The TokenBucket shared by every request in the crawl.
+        limiter: The AdaptiveLimiter shared by every request in the crawl.
+        cache: Optional PageCache used to send a conditional request.
+        retries: Number of times a throttled or failed request is retried.
+
+    Returns:
+        The body of the page as bytes, NOT_MODIFIED if the cached copy is current,
+        or None if it could not be downloaded.
+
+    """
+
+    headers = cache.request_headers(url) if cache else None
+
+    for attempt in range(1, retries + 2):
+        await bucket.wait_async()
+        retry_after = None
+
+        async with limiter.slot_async():
+            start = time.perf_counter()
+
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if response.status in THROTTLE_STATUSES:
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                        error = f'HTTP {response.status}'
+
+                    elif response.status == 304:
+                        limiter.record(time.perf_counter() - start)
+                        cache.not_modified(url)
+                        metrics.inc('pages_not_modified')
+                        return NOT_MODIFIED
+
+                    else:
+                        response.raise_for_status()
+                        body = await response.read()
+
+                        limiter.record(time.perf_counter() - start)
+
+                        if cache:
+                            cache.set_validators(url, response.headers.get('ETag'),
+                                                 response.headers.get('Last-Modified'))
+
+                        metrics.inc('pages_fetched')
+                        return body
+
+            except aiohttp.ClientResponseError as e:
+                # Client errors other than 429 won't go away by retrying
+                limiter.record(time.perf_counter() - start)
+                logging.error(f'Unable to fetch {url}: {e!r}')
+                metrics.inc('page_errors')
+                return None
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+
+            finally:
+                metrics.observe('page_fetch_seconds', time.perf_counter() - start)
+
+            limiter.record(time.perf_counter() - start, throttled=True)
+
+        if attempt > retries:
+            break
+
+        metrics.inc('page_retries')
+        await asyncio.sleep(backoff_delay(attempt, retry_after=retry_after))
+
+    logging.error(f'Unable to fetch {url} after {retries + 1} attempts: {error}')
+    metrics.inc('page_errors')
+    return None
+
+
+async def fetch_pages(urls, concurrency=20, per_host=8, rate=10.0, timeout=30, cache=None, initial_concurrency=4,
+                      burst=5, retries=3):
+    """
+    Downloads many pages concurrently over a pool of keep-alive connections.
+
+    The number of requests in flight starts at initial_concurrency and adapts to the site's latency and errors,
+    up to per_host.
+
+    Args:
+        urls: The urls of the pages to download.
+        concurrency: Maximum number of open connections.
+        per_host: Maximum number of open connections to a single host.
+        rate: Maximum number of requests started per second.
+        timeout: Seconds allowed for each request.
+        cache: Optional PageCache used to send conditional requests.
+        initial_concurrency: Number of requests in flight to start from.
+        burst: Number of requests that may start at once after an idle spell.
+        retries: Number of times a throttled or failed request is retried.
+
+    Returns:
+        A list of (url, body) tuples in the same order as urls. The body is None for failed requests
+        and NOT_MODIFIED for pages that have not changed.
+
+    """
+
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host)
+    bucket = TokenBucket(rate, burst)
+    limiter = AdaptiveLimiter(initial_concurrency, maximum=min(concurrency, per_host))
+
+    async with aiohttp.ClientSession(connector=connector, headers=HEADERS,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        pages = await asyncio.gather(*(fetch_page(session, url, bucket, limiter, cache, retries) for url in urls))
+
+    logging.info(f'Fetch concurrency {limiter.summary()}.')
+    metrics.set_gauge('fetch_concurrency', limiter.current)
+
+    return list(zip(urls, pages))
@@ -0,0 +1,180 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+
+# Directory the web server serves ticket images from
+IMG_DIR = '/var/www/html/img/'
+
+# Widths in pixels of the resized copies of each ticket image
+SIZES = (200, 400)
+
+# File formats written for each size
+FORMATS = ('jpg', 'webp')
+
+# Encoder quality of lossy formats
+QUALITY = 80
+
+
+def get_derivative_dir(img_dir):
+    return os.path.join(img_dir, 'derived')
+
+
+def get_derivative_paths(img_path, out_dir, sizes, formats):
+    """
+    Gets the path of every derivative of an image, ex. oh_5_1234_w200.webp.
+
+    Args:
+        img_path: Path of the source image.
+        out_dir: Directory derivatives are written to.
+        sizes: Widths of the resized copies.
+        formats: File extensions of the formats written.
+
+    Returns:
+        A list of (width, extension, path) tuples.
+
+    """
+
+    name = os.path.splitext(os.path.basename(img_path))[0]
+
+    return [(width, ext, os.path.join(out_dir, f'{name}_w{width}.{ext}')) for width in sizes for ext in formats]
+
+
+def is_stale(img_path, derivative_paths):
+    """
+    Checks whether any derivative of an image is missing or older than the image.
+    """
+
+    img_mtime = os.stat(img_path).st_mtime
+
+    for _, _, path in derivative_paths:
+        try:
+            if os.stat(path).st_mtime < img_mtime:
+                return True
+        except FileNotFoundError:
+            return True
+
+    return False
+
+
+def build_derivatives(img_path, derivative_paths, quality=QUALITY):
+    """
+    Writes every derivative of one image. Runs in a worker process.
+
+    Args:
+        img_path: Path of the source image.
+        derivative_paths: List of (width, extension, path) tuples to write.
+        quality: Encoder quality of lossy formats.
+
+    Returns:
+        The number of bytes written.
+
+    """
+
+    extensions = Image.registered_extensions()
+    size = 0
+
+    with Image.open(img_path) as img:
+        img = img.convert('RGB')
+
+        for width, ext, path in derivative_paths:
+            # Never scale up, small source images are re-encoded at their own size
+            height = round(img.height * min(width, img.width) / img.width)
+            resized = img.resize((min(width, img.width), height), Image.LANCZOS)
+
+            tmp_path = f'{path}.part'
+            resized.save(tmp_path, format=extensions[f'.{ext}'], quality=quality)
+            os.replace(tmp_path, path)
+
+            size += os.path.getsize(path)
+
+    return size
+
+
+def generate_derivatives(img_dir=IMG_DIR, sizes=SIZES, formats=FORMATS, quality=QUALITY, workers=None,
+                         img_paths=None):
+    """
+    Builds resized and re-encoded copies of every ticket image whose derivatives are missing or out of date.
+
+    Args:
+        img_dir: The image directory.
+        sizes: Widths in pixels of the resized copies.
+        formats: File extensions of the formats to write, ex. jpg, webp or avif.
+        quality: Encoder quality of lossy formats.
+        workers: Number of worker processes, one per core if not given.
+        img_paths: Only these images are checked if given, ex. the ones a sync just wrote, instead of scanning the
+            whole directory.
+
+    Returns:
+        A dictionary with the number of images processed and skipped, bytes written and failures.
+
+    """
+
+    out_dir = get_derivative_dir(img_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Skip formats this Pillow build can't encode
+    extensions = Image.registered_extensions()
+    supported = [ext for ext in formats if f'.{ext}' in extensions and extensions[f'.{ext}'] in Image.SAVE]
+    for ext in set(formats) - set(supported):
+        logging.error(f'Pillow is unable to write {ext} images, skipping that format.')
+
+    jobs = []
+    stats = {'images': 0, 'skipped': 0, 'bytes': 0, 'failures': 0}
+
+    if img_paths is None:
+        with os.scandir(img_dir) as entries:
+            img_paths = [os.path.join(img_dir, name) for name in sorted(
+                entry.name for entry in entries
+                if entry.is_file() and entry.name.startswith('oh_') and entry.name.endswith('.jpg'))]
+
+    for img_path in img_paths:
+        derivative_paths = get_derivative_paths(img_path, out_dir, sizes, supported)
+
+        if is_stale(img_path, derivative_paths):
+            jobs.append((img_path, derivative_paths))
+        else:
+            stats['skipped'] += 1
+
+    start = time.perf_counter()
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(build_derivatives, img_path, paths, quality): img_path
+                       for img_path, paths in jobs}
+
+            for future in as_completed(futures):
+                try:
+                    stats['bytes'] += future.result()
+                    stats['images'] += 1
+                except (OSError, ValueError) as e:
+                    stats['failures'] += 1
+                    logging.error(f'Unable to build derivatives of {futures[future]}: {e}')
+
+    logging.info(f"Derivatives built for {stats['images']} images ({stats['bytes']} bytes) in "
+                 f"{time.perf_counter() - start:.1f}s, {stats['skipped']} up to date, {stats['failures']} failed.")
+
+    return stats
+
+
+def main():
+    logging.basicConfig(filename='lotto_img.log', level=logging.INFO, format='%(asctime)s : %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p')
+
+    parser = argparse.ArgumentParser(description='Builds resized and re-encoded copies of the ticket images.')
+    parser.add_argument('--img-dir', default=IMG_DIR, help='directory of the ticket images')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='widths in pixels')
+    parser.add_argument('--formats', nargs='+', default=FORMATS, help='file extensions, ex. jpg webp avif')
+    parser.add_argument('--quality', type=int, default=QUALITY, help='encoder quality of lossy formats')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, one per core by default')
+    args = parser.parse_args()
+
+    logging.info('Started Ticket Image Derivatives...')
+    generate_derivatives(args.img_dir, sizes=args.sizes, formats=args.formats, quality=args.quality, workers=args.workers)
+    logging.info('Finished Ticket Image Derivatives.')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,25 @@
+import hashlib
+import json
 import logging
 import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
-import pathlib
-from sqlalchemy import create_engine
+import img_derivatives
+import metrics
+from sqlalchemy import bindparam, create_engine, text
+
+# Directory the web server serves ticket images from
+IMG_DIR = '/var/www/html/img/'
+
+# Bytes read from the response per write
+CHUNK_SIZE = 64 * 1024
+
+# Record of every synced image as pic_id -> url and sha256
+MANIFEST_PATH = 'img_manifest.json'
 
 
 def get_engine():
@@ -15,46 +31,342 @@ def get_engine():
     return create_engine(f'mysql+pymysql://{user}:{password}@{host}/{database}', pool_recycle=3600)
 
 
-def get_df():
+def get_df(known_urls=None, sql_engine=None):
     """
     Gets a DataFrame containing information about the image links for the tickets.
 
+    Args:
+        known_urls: Image urls that are already synced and can be left out.
+        sql_engine: Engine to use. A new engine is created if none is given.
+
     Returns:
         A DataFrame containing information about the image links for the tickets.
 
     """
 
-    sql_engine = get_engine()
+    sql_engine = sql_engine or get_engine()
     db_connection = sql_engine.connect()
 
-    df = pd.read_sql('SELECT DISTINCT pic, price, ticket_number FROM ticket', db_connection)
+    if known_urls:
+        query = text('SELECT DISTINCT pic, price, ticket_number FROM ticket WHERE pic NOT IN :known_urls')
+        query = query.bindparams(bindparam('known_urls', expanding=True))
+        df = pd.read_sql(query, db_connection, params={'known_urls': list(known_urls)})
+    else:
+        df = pd.read_sql('SELECT DISTINCT pic, price, ticket_number FROM ticket', db_connection)
+
     db_connection.close()
 
     return df
 
 
-def download_img(df):
+def load_manifest(path=MANIFEST_PATH):
+    """
+    Loads the manifest of synced images.
+
+    Args:
+        path: The JSON file the manifest is stored in.
+
+    Returns:
+        A dictionary of pic_id to a dictionary with the image's url and sha256.
+
+    """
+
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        logging.error(f'Unable to read image manifest {path}, starting empty.\n{e}')
+        return {}
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """
+    Writes the manifest of synced images, replacing the previous file atomically.
+
+    Args:
+        manifest: A dictionary of pic_id to a dictionary with the image's url and sha256.
+        path: The JSON file the manifest is stored in.
+
+    """
+
+    tmp_path = f'{path}.tmp'
+
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file)
+
+    os.replace(tmp_path, path)
+
+
+def scan_img_dir(img_dir=None):
+    """
+    Lists the image directory once.
+
+    Args:
+        img_dir: The image directory, IMG_DIR if not given.
+
+    Returns:
+        A set of the file names in the directory.
+
+    """
+
+    try:
+        with os.scandir(img_dir or IMG_DIR) as entries:
+            return {entry.name for entry in entries if entry.is_file()}
+    except FileNotFoundError:
+        return set()
+
+
+def get_known_urls(manifest, img_names):
+    """
+    Gets the urls of images that are in the manifest and still on disk.
+
+    Args:
+        manifest: The manifest of synced images.
+        img_names: File names in the image directory.
+
+    Returns:
+        A set of image urls that don't need to be synced again.
+
+    """
+
+    return {entry['url'] for pic_id, entry in manifest.items() if get_img_name(pic_id) in img_names}
+
+
+def get_img_name(pic_id):
+    return 'oh_' + pic_id + '.jpg'
+
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def get_session(pool_size):
+    """
+    Creates a session that keeps up to pool_size connections alive per host.
+
+    Args:
+        pool_size: Number of pooled connections, should match the number of download workers.
+
+    Returns:
+        A requests Session.
+
+    """
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+def fetch_img(session, url, img_path, timeout=30):
+    """
+    Streams an image to disk. The body is written to a temporary file that is renamed into place once complete,
+    so a partial download never looks like a finished image.
+
+    Args:
+        session: The session to download with.
+        url: The url of the image.
+        img_path: Path the image is saved to.
+        timeout: Seconds to wait for the server.
+
+    Returns:
+        A tuple of the temporary file path, bytes written and sha256.
+
+    """
+
+    size = 0
+    sha256 = hashlib.sha256()
+    with metrics.timer('image_download_seconds'), session.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(img_path), suffix='.part')
+
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    file.write(chunk)
+                    sha256.update(chunk)
+                    size += len(chunk)
+
+            # mkstemp creates the file readable by the owner only
+            os.chmod(tmp_path, 0o644)
+
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    return tmp_path, size, sha256.hexdigest()
+
+
+def store_img(tmp_path, img_path, sha256, hash_paths):
+    """
+    Moves a downloaded image into place, hard-linking an identical existing image instead of keeping a copy.
+
+    A linked image gets a new mtime, so the derivatives of the image it replaced are seen as stale and rebuilt.
+
+    Args:
+        tmp_path: The downloaded temporary file.
+        img_path: Path the image is saved to.
+        sha256: The hash of the downloaded image.
+        hash_paths: Dictionary of sha256 to the path of an image with that content.
+
+    Returns:
+        True if the image was hard-linked to an existing file.
+
+    """
+
+    existing = hash_paths.setdefault(sha256, img_path)
+
+    if existing != img_path and os.path.exists(existing):
+        try:
+            link_path = f'{tmp_path}.link'
+            os.link(existing, link_path)
+            os.replace(link_path, img_path)
+            os.unlink(tmp_path)
+
+            # The link shares the existing file's inode, so this also rebuilds that file's derivatives once
+            os.utime(img_path)
+            return True
+        except OSError as e:
+            logging.error(f'Unable to hard link {img_path} to {existing}, keeping a copy.\n{e}')
+
+    os.replace(tmp_path, img_path)
+    return False
+
+
+def download_img(df, workers=8, manifest=None, img_names=None):
     """
     Downloads ticket images if they don't already exist.
 
+    Images already on disk that are missing from the manifest are hashed and adopted without a download. Images in
+    the manifest whose url changed are downloaded again, and hard-linked if their content didn't change.
+
     Args:
         df: A DataFrame containing information about the image links for the tickets.
+        workers: Number of images downloaded at the same time.
+        manifest: The manifest of synced images, updated in place.
+        img_names: File names in the image directory, scanned if not given.
+
+    Returns:
+        A dictionary with the number of files and bytes downloaded, hard links, failures and files per second, and
+        the paths of the images written or adopted.
 
     """
 
+    manifest = {} if manifest is None else manifest
+    img_names = scan_img_dir() if img_names is None else img_names
+
     df['pic_id'] = df['price'].astype(str) + "_" + df['ticket_number'].astype(str)
 
     img_values = df[['pic', 'pic_id']].values.tolist()
+    downloads = []
+    paths = []
+
+    hash_paths = {entry['sha256']: IMG_DIR + get_img_name(pic_id)
+                  for pic_id, entry in manifest.items() if entry.get('sha256') and get_img_name(pic_id) in img_names}
+
+    for url, pic_id in img_values:
+        img_path = IMG_DIR + get_img_name(pic_id)
+        entry = manifest.get(pic_id)
+
+        if get_img_name(pic_id) not in img_names:
+            downloads.append((url, pic_id, img_path))
+
+        elif entry is None:
+            # Image synced before the manifest existed
+            sha256 = hash_file(img_path)
+            manifest[pic_id] = {'url': url, 'sha256': sha256}
+            hash_paths.setdefault(sha256, img_path)
+            paths.append(img_path)
+
+        elif entry['url'] != url:
+            downloads.append((url, pic_id, img_path))
+
+    stats = {'files': 0, 'bytes': 0, 'links': 0, 'failures': 0, 'files_per_sec': 0.0, 'paths': paths}
+    start = time.perf_counter()
 
-    for img_value in img_values:
-        img_path = '/var/www/html/img/' + 'oh_' + img_value[1] + '.jpg'
-        file = pathlib.Path(img_path)
+    if downloads:
+        with get_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(fetch_img, session, url, img_path): (url, pic_id, img_path)
+                       for url, pic_id, img_path in downloads}
 
-        if not file.exists():
-            pull_img = requests.get(img_value[0], stream=True)
-            if pull_img.ok:
-                with open(img_path, 'wb+') as file:
-                    file.write(pull_img.raw.read())
+            for future in as_completed(futures):
+                url, pic_id, img_path = futures[future]
+
+                try:
+                    tmp_path, size, sha256 = future.result()
+                    stats['links'] += store_img(tmp_path, img_path, sha256, hash_paths)
+                    manifest[pic_id] = {'url': url, 'sha256': sha256}
+                    paths.append(img_path)
+
+                    stats['bytes'] += size
+                    stats['files'] += 1
+                    metrics.inc('images_downloaded')
+                    metrics.inc('image_bytes', size)
+
+                except (requests.RequestException, OSError) as e:
+                    stats['failures'] += 1
+                    metrics.inc('image_failures')
+                    logging.error(f'Unable to download image {url}: {e}')
+
+    elapsed = time.perf_counter() - start
+    stats['files_per_sec'] = stats['files'] / elapsed if elapsed else 0.0
+
+    logging.info(f"{stats['files']} images downloaded ({stats['bytes']} bytes, "
+                 f"{stats['files_per_sec']:.1f} files/sec), {stats['links']} hard-linked, {stats['failures']} failed.")
+
+    return stats
+
+
+def sync_images(df=None, sql_engine=None):
+    """
+    Downloads new and changed ticket images and builds their derivatives.
+
+    Args:
+        df: Optional DataFrame with pic, price and ticket_number columns, ex. the tickets just scraped. Every ticket in
+            the database is synced if not given.
+        sql_engine: Engine to use when reading the tickets from the database.
+
+    Returns:
+        The download stats, or None if df had no images that aren't already synced.
+
+    """
+
+    manifest = load_manifest()
+    img_names = scan_img_dir()
+    known_urls = get_known_urls(manifest, img_names)
+
+    if df is None:
+        df = get_df(known_urls, sql_engine)
+    else:
+        df = df[df['pic'].astype(bool) & ~df['pic'].isin(known_urls)]
+        df = df[['pic', 'price', 'ticket_number']].drop_duplicates().reset_index(drop=True)
+
+        if df.empty:
+            logging.info('No new ticket images.')
+            return None
+
+    stats = download_img(df, manifest=manifest, img_names=img_names)
+
+    save_manifest(manifest)
+
+    # Build thumbnails and WebP copies of new or replaced images only, img_derivatives.py backfills the whole directory
+    if stats['paths']:
+        with metrics.timer('image_derivatives_seconds'):
+            img_derivatives.generate_derivatives(IMG_DIR, img_paths=stats['paths'])
+
+    return stats
 
 
 def main():
@@ -62,8 +374,9 @@ def main():
                         datefmt='%m/%d/%Y %I:%M:%S %p')
     logging.info('Started Ticket Images...')
 
-    df = get_df()
-    download_img(df)
+    sync_images()
+
+    metrics.write('images')
 
     logging.info('Finished Ticket Images.')
 
@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Directory metrics files are written to, point the node exporter's textfile collector here
+METRICS_DIR = os.environ.get('LOTTO_METRICS_DIR', '.')
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+lock = threading.Lock()
+counters = {}
+gauges = {}
+histograms = {}
+
+
+class Histogram:
+    """
+    Cumulative latency histogram with fixed buckets, as exported to Prometheus.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimates a quantile by interpolating within the bucket it falls in.
+        """
+
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            if count and seen + count >= rank:
+                return min(lower + (bound - lower) * (rank - seen) / count, self.max)
+            seen += count
+            lower = bound
+
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': round(self.quantile(0.5), 6),
+            'p95': round(self.quantile(0.95), 6),
+            'max': round(self.max, 6),
+        }
+
+
+def inc(name, value=1):
+    """
+    Adds to a counter.
+
+    Args:
+        name: Name of the counter, ex. rows_inserted.
+        value: Amount to add.
+
+    """
+
+    with lock:
+        counters[name] = counters.get(name, 0) + value
+
+
+def set_gauge(name, value):
+    """
+    Sets a gauge to the value it ended the run at.
+
+    Args:
+        name: Name of the gauge, ex. fetch_concurrency.
+        value: The value.
+
+    """
+
+    with lock:
+        gauges[name] = value
+
+
+def observe(name, seconds):
+    """
+    Records a latency in a histogram.
+
+    Args:
+        name: Name of the histogram, ex. page_fetch_seconds.
+        seconds: The observed latency.
+
+    """
+
+    with lock:
+        histograms.setdefault(name, Histogram()).observe(seconds)
+
+
+def get_histogram(name):
+    with lock:
+        return histograms.get(name, Histogram())
+
+
+@contextmanager
+def timer(name):
+    """
+    Records how long a with block takes in a histogram.
+
+    Args:
+        name: Name of the histogram, ex. db_insert_seconds.
+
+    """
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def summary():
+    """
+    Gets every counter and a summary of every histogram.
+
+    Returns:
+        A dictionary with counters and histograms.
+
+    """
+
+    with lock:
+        return {
+            'counters': dict(counters),
+            'gauges': dict(gauges),
+            'histograms': {name: histogram.summary() for name, histogram in histograms.items()},
+        }
+
+
+def to_prometheus(job):
+    """
+    Formats every metric in the Prometheus text exposition format.
+
+    Args:
+        job: Name of the job, added as a label.
+
+    Returns:
+        The metrics as a string.
+
+    """
+
+    lines = []
+
+    with lock:
+        for name, value in sorted(counters.items()):
+            lines.append(f'# TYPE lotto_{name}_total counter')
+            lines.append(f'lotto_{name}_total{{job="{job}"}} {value}')
+
+        for name, value in sorted(gauges.items()):
+            lines.append(f'# TYPE lotto_{name} gauge')
+            lines.append(f'lotto_{name}{{job="{job}"}} {value}')
+
+        for name, histogram in sorted(histograms.items()):
+            lines.append(f'# TYPE lotto_{name} histogram')
+            cumulative = 0
+
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'lotto_{name}_bucket{{job="{job}",le="{bound}"}} {cumulative}')
+
+            lines.append(f'lotto_{name}_bucket{{job="{job}",le="+Inf"}} {histogram.count}')
+            lines.append(f'lotto_{name}_sum{{job="{job}"}} {histogram.sum}')
+            lines.append(f'lotto_{name}_count{{job="{job}"}} {histogram.count}')
+
+    lines.append('# TYPE lotto_last_run_timestamp_seconds gauge')
+    lines.append(f'lotto_last_run_timestamp_seconds{{job="{job}"}} {time.time():.0f}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def write(job, metrics_dir=None):
+    """
+    Writes the metrics of a run as a Prometheus textfile and a JSON summary, replacing the previous run's files.
+
+    Args:
+        job: Name of the job, used in the file names, ex. lotto_scrape.prom and lotto_scrape.json.
+        metrics_dir: Directory to write to, METRICS_DIR if not given.
+
+    """
+
+    metrics_dir = metrics_dir or METRICS_DIR
+
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+
+        for ext, content in (('prom', to_prometheus(job)), ('json', json.dumps(summary(), indent=2))):
+            path = os.path.join(metrics_dir, f'lotto_{job}.{ext}')
+
+            with open(f'{path}.tmp', 'w') as file:
+                file.write(content)
+
+            os.replace(f'{path}.tmp', path)
+
+    except OSError as e:
+        logging.error(f'Unable to write metrics to {metrics_dir}.\n{e}')
+
+
+def reset():
+    """
+    Clears every metric, for processes that run several jobs.
+    """
+
+    with lock:
+        counters.clear()
+        gauges.clear()
+        histograms.clear()
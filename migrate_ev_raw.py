@@ -0,0 +1,45 @@
+import argparse
+import logging
+from sqlalchemy import text
+from ticket_stats import BATCH_SIZE, get_engine, update_stats
+
+
+def add_ev_raw(sql_engine):
+    """
+    Adds the ev_raw column to the prize_stats table, holding the estimated value before it is normalized.
+
+    Args:
+        sql_engine: Engine to use.
+
+    """
+
+    with sql_engine.begin() as db_connection:
+        exists = db_connection.execute(text("SELECT COUNT(*) FROM information_schema.columns "
+                                            "WHERE table_schema = DATABASE() AND table_name = 'prize_stats' "
+                                            "AND column_name = 'ev_raw'")).scalar()
+
+        if not exists:
+            db_connection.execute(text('ALTER TABLE prize_stats ADD COLUMN ev_raw DOUBLE NULL AFTER top_prizes_rem'))
+            logging.info('Added prize_stats.ev_raw.')
+
+
+def main(batch_size=BATCH_SIZE):
+    logging.basicConfig(filename='lotto_stats.log', level=logging.INFO, format='%(asctime)s : %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p')
+    logging.info('Started ev_raw migration...')
+
+    sql_engine = get_engine()
+    add_ev_raw(sql_engine)
+
+    # Stored ev_scores were normalized per batch, recalculate every row against one set of bounds
+    update_stats(sql_engine, rebuild=True, batch_size=batch_size)
+
+    logging.info('Finished ev_raw migration.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Adds prize_stats.ev_raw and recalculates every ev_score.')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='prize rows processed per batch')
+    args = parser.parse_args()
+
+    main(args.batch_size)
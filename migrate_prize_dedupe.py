@@ -0,0 +1,126 @@
+import argparse
+import json
+import logging
+from ticket_scrape import get_conn
+
+# Number of duplicate rows deleted per statement
+CHUNK_SIZE = 1000
+
+
+def add_last_seen(conn):
+    """
+    Adds the last_seen column to the prize table and the index used to find each ticket's latest snapshot.
+
+    Args:
+        conn: The database connection.
+
+    """
+
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT COUNT(*) FROM information_schema.columns "
+                   "WHERE table_schema = DATABASE() AND table_name = 'prize' AND column_name = 'last_seen'")
+    if not cursor.fetchone()[0]:
+        cursor.execute('ALTER TABLE prize ADD COLUMN last_seen DATETIME NULL')
+        logging.info('Added prize.last_seen.')
+
+    cursor.execute("SELECT COUNT(*) FROM information_schema.statistics "
+                   "WHERE table_schema = DATABASE() AND table_name = 'prize' AND index_name = 'prize_ticket_latest'")
+    if not cursor.fetchone()[0]:
+        cursor.execute('CREATE INDEX prize_ticket_latest ON prize (ticket_number, prize_id)')
+        logging.info('Added index prize_ticket_latest.')
+
+    cursor.execute('UPDATE prize SET last_seen = time WHERE last_seen IS NULL')
+    conn.commit()
+    cursor.close()
+
+
+def find_duplicates(conn):
+    """
+    Finds prize snapshots that are identical to the previous snapshot of the same ticket.
+
+    Args:
+        conn: The database connection.
+
+    Returns:
+        A tuple of the list of duplicate prize_ids and a dictionary of kept prize_id to its new last_seen time.
+
+    """
+
+    cursor = conn.cursor()
+    cursor.execute('SELECT prize_id, ticket_number, prize, last_seen FROM prize ORDER BY ticket_number, prize_id')
+
+    duplicates = []
+    last_seen = {}
+    kept_id = kept_ticket = kept_prize = None
+
+    for prize_id, ticket_number, prize, seen in cursor:
+        prize = json.loads(prize)
+
+        if ticket_number == kept_ticket and prize == kept_prize:
+            duplicates.append(prize_id)
+            last_seen[kept_id] = max(seen, last_seen.get(kept_id, seen))
+        else:
+            kept_id, kept_ticket, kept_prize = prize_id, ticket_number, prize
+
+    cursor.close()
+
+    return duplicates, last_seen
+
+
+def compact(conn, duplicates, last_seen):
+    """
+    Deletes duplicate snapshots and their stats, folding their times into the kept snapshot's last_seen.
+
+    Args:
+        conn: The database connection.
+        duplicates: List of duplicate prize_ids.
+        last_seen: Dictionary of kept prize_id to its new last_seen time.
+
+    """
+
+    cursor = conn.cursor()
+
+    cursor.executemany('UPDATE prize SET last_seen = %s WHERE prize_id = %s',
+                       [(seen, prize_id) for prize_id, seen in last_seen.items()])
+    conn.commit()
+
+    for i in range(0, len(duplicates), CHUNK_SIZE):
+        chunk = duplicates[i:i + CHUNK_SIZE]
+        placeholders = ', '.join(['%s' for _ in chunk])
+
+        cursor.execute(f'DELETE FROM prize_stats WHERE prize_id IN ({placeholders})', chunk)
+        cursor.execute(f'DELETE FROM prize WHERE prize_id IN ({placeholders})', chunk)
+        conn.commit()
+
+        logging.info(f'Deleted {i + len(chunk)} of {len(duplicates)} duplicate snapshots.')
+
+    cursor.close()
+
+
+def main(dry_run=False):
+    logging.info('Started prize dedupe migration...')
+
+    conn = get_conn()
+
+    try:
+        add_last_seen(conn)
+        duplicates, last_seen = find_duplicates(conn)
+
+        logging.info(f'{len(duplicates)} duplicate snapshots found across {len(last_seen)} kept snapshots.')
+
+        if not dry_run:
+            compact(conn, duplicates, last_seen)
+
+    finally:
+        conn.close()
+
+    logging.info('Finished prize dedupe migration.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Adds prize.last_seen and removes unchanged prize snapshots.')
+    parser.add_argument('--dry-run', action='store_true', help='only count the duplicate snapshots')
+    args = parser.parse_args()
+
+    main(args.dry_run)
@@ -0,0 +1,59 @@
+import argparse
+import logging
+import pandas as pd
+from ticket_scrape import create_tier_table, get_conn, get_tier_df, insert_df
+
+# Number of prize snapshots converted per batch
+BATCH_SIZE = 2000
+
+
+def backfill(conn, batch_size=BATCH_SIZE):
+    """
+    Converts every stored prize snapshot into prize_tier rows. Snapshots that were already converted are ignored.
+
+    Args:
+        conn: The database connection.
+        batch_size: Number of prize snapshots converted per batch.
+
+    """
+
+    cursor = conn.cursor()
+    last_id = 0
+
+    while True:
+        cursor.execute('SELECT prize_id, ticket_number, prize, time FROM prize '
+                       'WHERE prize_id > %s ORDER BY prize_id LIMIT %s', (last_id, batch_size))
+        rows = cursor.fetchall()
+
+        if not rows:
+            break
+
+        prize_df = pd.DataFrame(rows, columns=['prize_id', 'ticket_number', 'prize', 'time'])
+        insert_df(get_tier_df(prize_df), 'prize_tier', ignore=True, conn=conn)
+
+        last_id = prize_df['prize_id'].max()
+        logging.info(f'prize_tier : backfilled up to prize_id {last_id}.')
+
+    cursor.close()
+
+
+def main(batch_size=BATCH_SIZE):
+    logging.info('Started prize tier migration...')
+
+    conn = get_conn()
+
+    try:
+        create_tier_table(conn)
+        backfill(conn, batch_size)
+    finally:
+        conn.close()
+
+    logging.info('Finished prize tier migration.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Creates prize_tier and fills it from the stored prize snapshots.')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='prize snapshots converted per batch')
+    args = parser.parse_args()
+
+    main(args.batch_size)
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+
+
+class PageCache:
+    """
+    On-disk cache of HTTP validators and prize table hashes for ticket pages, keyed by URL.
+
+    Changes are kept in memory until save() is called, so a page is only considered seen once its data has been
+    written to the database.
+
+    Args:
+        path: The JSON file the cache is stored in.
+
+    """
+
+    def __init__(self, path='page_cache.json'):
+        self.path = path
+        self.entries = {}
+        self.skipped = 0
+
+        if os.path.exists(path):
+            try:
+                with open(path) as file:
+                    self.entries = json.load(file)
+            except (OSError, ValueError) as e:
+                logging.error(f'Unable to read page cache {path}, starting empty.\n{e}')
+
+    def request_headers(self, url):
+        """
+        Gets the conditional request headers for a page.
+
+        Args:
+            url: The url of the page.
+
+        Returns:
+            A dictionary of If-None-Match and If-Modified-Since headers for the cached validators.
+
+        """
+
+        entry = self.entries.get(url, {})
+        headers = {}
+
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        return headers
+
+    def set_validators(self, url, etag=None, last_modified=None):
+        """
+        Stores the ETag and Last-Modified headers returned for a page.
+
+        Args:
+            url: The url of the page.
+            etag: The ETag response header.
+            last_modified: The Last-Modified response header.
+
+        """
+
+        entry = self.entries.setdefault(url, {})
+        entry['etag'] = etag
+        entry['last_modified'] = last_modified
+
+    def not_modified(self, url):
+        """
+        Records that the server answered a conditional request for a page with 304 Not Modified.
+
+        Args:
+            url: The url of the page.
+
+        """
+
+        logging.info(f'Page not modified: {url}')
+        self.skipped += 1
+
+    @staticmethod
+    def prize_hash(ticket_prize):
+        return hashlib.sha256(ticket_prize.encode()).hexdigest()
+
+    def hash_changed(self, url, prize_hash):
+        """
+        Checks a page's prize table hash against the hash stored for it, without storing the new one.
+
+        Args:
+            url: The url of the page.
+            prize_hash: Hash of the prize table, from prize_hash.
+
+        Returns:
+            True if the prize table is new or differs from the cached one.
+
+        """
+
+        if self.entries.get(url, {}).get('prize_hash') == prize_hash:
+            logging.info(f'Prize table unchanged: {url}')
+            self.skipped += 1
+            return False
+
+        return True
+
+    def set_prize_hash(self, url, prize_hash):
+        """
+        Stores a page's prize table hash, once the prize table is written to the database.
+
+        Args:
+            url: The url of the page.
+            prize_hash: Hash of the prize table, from prize_hash.
+
+        """
+
+        self.entries.setdefault(url, {})['prize_hash'] = prize_hash
+
+    def prize_changed(self, url, ticket_prize):
+        """
+        Checks a page's prize table against the hash stored for it and stores the new hash.
+
+        Args:
+            url: The url of the page.
+            ticket_prize: The prize table of the ticket as a JSON string.
+
+        Returns:
+            True if the prize table is new or differs from the cached one.
+
+        """
+
+        prize_hash = self.prize_hash(ticket_prize)
+
+        if not self.hash_changed(url, prize_hash):
+            return False
+
+        self.set_prize_hash(url, prize_hash)
+        return True
+
+    def save(self):
+        """
+        Writes the cache to disk, replacing the previous file atomically.
+        """
+
+        tmp_path = f'{self.path}.tmp'
+
+        with open(tmp_path, 'w') as file:
+            json.dump(self.entries, file)
+
+        os.replace(tmp_path, self.path)
+        logging.info(f'Page cache saved ({len(self.entries)} pages, {self.skipped} skipped this run).')
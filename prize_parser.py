@@ -0,0 +1,130 @@
+import logging
+import re
+import threading
+from functools import lru_cache
+import numpy as np
+
+# ex. 1,000 or $1,000.00
+NUMBER = re.compile(r'\s*[-+]?(?:\d+\.?\d*|\.\d+)(?:E[-+]?\d+)?\s*')
+
+# ex. TPD ENTRY & 5500 Tax Free, TPD ENTRY & 5500
+ENTRY_AND_CASH = re.compile(r'&\s*(\d+(?:\.\d+)?)\b')
+
+# ex. 250K/YR FOR LIFE/TPD, top prize drawing, not counted as a prize
+NOT_CASH = re.compile(r'TPD|MEGAPLIER|ENTRY|DRAWING')
+
+# ex. 250K/YR FOR LIFE
+FOR_LIFE = re.compile(r'\s*(\d+(?:\.\d+)?)K*[/\s]')
+
+# ex. 2500/MO FOR 10YRS, 50K/YR FOR 20 YRS
+FOR_YEARS = re.compile(r'\s*(\d+(?:\.\d+)?)(K?)[^/]*/([^/]*?)FOR\s*(\d+(?:\.\d+)?)')
+
+# ex. 1000000(40K/YR/25YRS)
+LUMP_SUM = re.compile(r'\s*(\d+(?:\.\d+)?)\s*\(.*\)')
+
+# Years of payments a lifetime prize is counted as
+LIFE_YEARS = 20
+
+# Labels that have already been reported as unparseable
+unparseable = set()
+unparseable_lock = threading.Lock()
+
+
+def report_unparseable(label):
+    with unparseable_lock:
+        if label in unparseable:
+            return
+        unparseable.add(label)
+
+    logging.info(f'Value Error while transforming prize amounts. {label}')
+
+
+@lru_cache(maxsize=4096)
+def parse_prize_amount(label):
+    """
+    Converts a prize tier label into a dollar amount.
+
+    Results are memoized, so each distinct label is only parsed once. Labels that can't be parsed are valued at 0
+    and reported the first time they are seen.
+
+    Args:
+        label: The prize tier label, ex. $1,000, 250K/YR FOR LIFE or 2500/MO FOR 10YRS.
+
+    Returns:
+        The dollar amount of the prize as a float.
+
+    """
+
+    amt = label.replace(',', '').replace('$', '').upper()
+
+    if NUMBER.fullmatch(amt):
+        return float(amt)
+
+    if '&' in amt:
+        match = ENTRY_AND_CASH.search(amt)
+        if match:
+            return float(match.group(1))
+
+    elif NOT_CASH.search(amt):
+        return 0.0
+
+    elif 'LIFE' in amt:
+        match = FOR_LIFE.match(amt)
+        if match:
+            return float(match.group(1)) * 1000 * LIFE_YEARS
+
+    elif 'FOR' in amt:
+        match = FOR_YEARS.match(amt)
+        if match:
+            val, thousands, period, years = match.groups()
+            val = float(val) * (1000 if thousands else 1)
+
+            # Change val to represent the amount for one year
+            if 'MO' in period:
+                val *= 12
+
+            return val * float(years)
+
+    elif '(' in amt and ')' in amt:
+        match = LUMP_SUM.match(amt)
+        if match:
+            return float(match.group(1))
+
+    report_unparseable(label)
+    return 0.0
+
+
+def parse_prize_amounts(labels):
+    """
+    Converts many prize tier labels into dollar amounts, parsing each distinct label once.
+
+    Args:
+        labels: A sequence of prize tier labels.
+
+    Returns:
+        A float array of the dollar amount of each label.
+
+    """
+
+    labels = np.asarray(labels, dtype=str)
+
+    if labels.size == 0:
+        return np.zeros(0)
+
+    unique_labels, label_index = np.unique(labels, return_inverse=True)
+    amounts = np.fromiter((parse_prize_amount(label) for label in unique_labels), dtype=float,
+                          count=len(unique_labels))
+
+    return amounts[label_index]
+
+
+def cache_info():
+    """
+    Gets the memo cache statistics of the parser.
+
+    Returns:
+        A named tuple of hits, misses, maxsize and currsize.
+
+    """
+
+    return parse_prize_amount.cache_info()
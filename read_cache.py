@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# File whose content changes whenever the stats are updated, shared by the jobs and the API processes
+VERSION_PATH = os.environ.get('LOTTO_CACHE_VERSION', 'stats_version')
+
+
+def invalidate(path=None):
+    """
+    Marks every cached read as stale, in this process and in any API process reading the same version file.
+
+    The data is already written when this runs, so a failed write is logged rather than raised and cached reads
+    expire after their time to live instead.
+
+    Args:
+        path: The version file, VERSION_PATH if not given.
+
+    """
+
+    path = path or VERSION_PATH
+    tmp_path = f'{path}.tmp'
+
+    try:
+        with open(tmp_path, 'w') as file:
+            file.write(str(time.time_ns()))
+
+        os.replace(tmp_path, path)
+
+    except OSError as e:
+        logging.error(f'Unable to update cache version {path}.\n{e}')
+
+
+def get_version(path=None):
+    try:
+        with open(path or VERSION_PATH) as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+class TTLCache:
+    """
+    Size-bounded cache whose entries expire after a time to live or when the version file changes.
+
+    The least recently used entry is evicted once maxsize entries are cached. Concurrent misses on the same key
+    wait for the first one's load instead of each running the query.
+
+    Args:
+        maxsize: Maximum number of entries.
+        ttl: Seconds an entry is served for.
+        version_path: The version file checked for invalidations, VERSION_PATH if not given.
+        check_interval: Minimum number of seconds between reads of the version file.
+
+    """
+
+    def __init__(self, maxsize=256, ttl=300, version_path=None, check_interval=1.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version_path = version_path
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._version = get_version(version_path)
+        self._checked = time.monotonic()
+
+    def _check_version(self, now):
+        if now - self._checked < self.check_interval:
+            return
+
+        self._checked = now
+        version = get_version(self.version_path)
+
+        if version != self._version:
+            self._version = version
+            self._entries.clear()
+
+    def get(self, key, load):
+        """
+        Gets a cached value, loading and caching it on a miss.
+
+        Args:
+            key: The cache key.
+            load: Function called without arguments to load the value.
+
+        Returns:
+            The value.
+
+        """
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._check_version(now)
+                entry = self._entries.get(key)
+
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+
+                loading = self._loading.get(key)
+
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    version = self._version
+                    self.misses += 1
+                    break
+
+            # Another thread is loading the key, use its value once it is done
+            loading.wait()
+
+        try:
+            value = load()
+
+            # A value loaded while the stats were being updated may already be stale
+            if get_version(self.version_path) != version:
+                return value
+
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+            return value
+
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
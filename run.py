@@ -0,0 +1,134 @@
+import argparse
+import logging
+import os
+import time
+import img_download
+import metrics
+import ticket_export
+import ticket_rollups
+import ticket_scrape
+import ticket_sim
+import ticket_stats
+from crawl_state import CrawlCheckpoint
+from page_cache import PageCache
+from sqlalchemy import create_engine
+
+# Stages in the order they run, each one only runs after the stages before it
+STAGES = ('scrape', 'stats', 'rollups', 'sim', 'export', 'images')
+
+
+def get_engine(pool_size=2):
+    """
+    Creates the engine every stage of the run shares.
+
+    The mysql.connector driver is used so the raw connections the scraper borrows raise the errors its inserts handle.
+
+    Args:
+        pool_size: Number of connections kept open, one for the scrape writer and one for the other stages.
+
+    Returns:
+        A SQLAlchemy engine.
+
+    """
+
+    user = 'user'
+    password = os.environ['LOTTO_KEY']
+    host = 'localhost'
+    database = 'lottoluck'
+
+    return create_engine(f'mysql+mysqlconnector://{user}:{password}@{host}/{database}',
+                         pool_size=pool_size, pool_recycle=3600, pool_pre_ping=True)
+
+
+def run(stages=STAGES, rebuild=False, fresh=False):
+    """
+    Runs the scrape, stats, rollup, simulation, export and image jobs in one process.
+
+    Rows written by the scrape are handed to the stats and image stages in memory. A stage is skipped when the scrape
+    ran and produced nothing for it. Stages run without the scrape read what they need from the database.
+
+    Args:
+        stages: Names of the stages to run.
+        rebuild: Whether to recalculate stats for every prize row.
+        fresh: Whether to ignore the progress of an interrupted crawl.
+
+    """
+
+    sql_engine = get_engine()
+    images_df = snapshot_df = None
+
+    try:
+        if 'scrape' in stages:
+            start = time.perf_counter()
+            summary = ticket_scrape.stream_tickets(cache=PageCache(), sql_engine=sql_engine,
+                                                   checkpoint=CrawlCheckpoint(fresh=fresh))
+            images_df, snapshot_df = summary['images'], summary['snapshots']
+            snapshots = 'unknown' if snapshot_df is None else len(snapshot_df)
+            logging.info(f"scrape : {summary['tickets']} tickets scraped, {snapshots} new prize snapshots, "
+                         f"{summary['failed']} failed ({time.perf_counter() - start:.1f}s).")
+
+        if 'stats' in stages:
+            if snapshot_df is not None and snapshot_df.empty and not rebuild:
+                logging.info('stats : skipped, no new prize snapshots.')
+            else:
+                start = time.perf_counter()
+                rows = ticket_stats.update_stats(sql_engine, snapshot_df, rebuild)
+                logging.info(f'stats : {rows} prize rows processed ({time.perf_counter() - start:.1f}s).')
+
+        if 'rollups' in stages:
+            if snapshot_df is not None and snapshot_df.empty:
+                logging.info('rollups : skipped, no new prize snapshots.')
+            else:
+                start = time.perf_counter()
+                rows = ticket_rollups.update_rollups(sql_engine)
+                logging.info(f'rollups : {rows} rollup rows written ({time.perf_counter() - start:.1f}s).')
+
+        if 'sim' in stages:
+            if snapshot_df is not None and snapshot_df.empty:
+                logging.info('sim : skipped, no new prize snapshots.')
+            else:
+                start = time.perf_counter()
+                games = ticket_sim.update_sims(sql_engine)
+                logging.info(f'sim : {games} games simulated ({time.perf_counter() - start:.1f}s).')
+
+        if 'export' in stages:
+            if snapshot_df is not None and snapshot_df.empty:
+                logging.info('export : skipped, no new prize snapshots.')
+            else:
+                start = time.perf_counter()
+                export = ticket_export.export(sql_engine)
+                logging.info(f"export : version {export['version']}, {export['written']} files written "
+                             f"({time.perf_counter() - start:.1f}s).")
+
+        if 'images' in stages:
+            if images_df is not None and images_df.empty:
+                logging.info('images : skipped, no tickets scraped.')
+            else:
+                start = time.perf_counter()
+                img_download.sync_images(images_df, sql_engine)
+                logging.info(f'images : finished ({time.perf_counter() - start:.1f}s).')
+
+    finally:
+        sql_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs every job of a scrape cycle as one pipeline.')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help='stages to run, all by default')
+    parser.add_argument('--rebuild', action='store_true', help='recalculate stats for every prize row')
+    parser.add_argument('--fresh', action='store_true', help='ignore the progress of an interrupted crawl')
+    args = parser.parse_args()
+
+    logging.info('Started run...')
+
+    try:
+        run([stage for stage in STAGES if stage in args.stages], args.rebuild, args.fresh)
+    except Exception as e:
+        logging.exception(e)
+
+    metrics.write('run')
+    logging.info('Finished run.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+# Status codes that mean the site is overloaded or throttling us
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Caps the request rate, allowing short bursts. Safe to share between threads and coroutines.
+
+    Args:
+        rate: Tokens added per second. A falsy rate disables the limit.
+        burst: Maximum number of tokens saved up while idle.
+
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token, going into debt if none are left.
+
+        Returns:
+            The number of seconds to wait before the token may be used.
+
+        """
+
+        if not self.rate:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+
+            return max(0.0, -self._tokens / self.rate)
+
+    def wait(self):
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def wait_async(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0, retry_after=None):
+    """
+    Gets how long to wait before retrying, exponential in the attempt with full jitter.
+
+    Args:
+        attempt: Number of attempts already made, starting at 1.
+        base: Upper bound in seconds of the first delay.
+        cap: Maximum delay in seconds.
+        retry_after: Seconds the server asked us to wait, used as a lower bound.
+
+    Returns:
+        The delay in seconds.
+
+    """
+
+    delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+    return max(delay, min(retry_after, cap)) if retry_after else delay
+
+
+def parse_retry_after(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    Limits the number of requests in flight, adjusting the limit from the latency and errors of finished requests.
+
+    The limit grows by one for every limit's worth of fast successes and is halved when the site throttles or
+    fails a request. Responses much slower than the fastest seen shrink it by a tenth. After a decrease, the
+    requests that were already in flight are ignored so one slow spell only counts once.
+
+    Args:
+        initial: Limit to start from.
+        minimum: Lowest the limit can go.
+        maximum: Highest the limit can go.
+        tolerance: Latency, as a multiple of the fastest response, above which the site is considered congested.
+        slack: Seconds added to the congestion threshold so fast, noisy responses don't count as congestion.
+
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=32, tolerance=3.0, slack=0.25):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.slack = slack
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.peak = int(self.limit)
+        self.decreases = 0
+        self.in_flight = 0
+        self._fastest = None
+        self._completed = 0
+        self._ignore_until = 0
+        self._cond = threading.Condition()
+        self._async_cond = None
+
+    @property
+    def current(self):
+        return int(self.limit)
+
+    def _try_acquire(self):
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+
+        return False
+
+    def record(self, latency, throttled=False):
+        """
+        Adjusts the limit from a finished request.
+
+        Args:
+            latency: Seconds the request took.
+            throttled: Whether the request was throttled or failed.
+
+        """
+
+        with self._cond:
+            self._completed += 1
+            recovering = self._completed <= self._ignore_until
+
+            if not throttled:
+                self._fastest = latency if self._fastest is None else min(self._fastest, latency)
+
+            if throttled or latency > self._fastest * self.tolerance + self.slack:
+                if not recovering:
+                    self.limit = max(self.minimum, self.limit * (0.5 if throttled else 0.9))
+                    self.decreases += 1
+                    self._ignore_until = self._completed + self.in_flight
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self.peak = max(self.peak, int(self.limit))
+
+    @contextmanager
+    def slot(self):
+        """
+        Holds one of the limit's slots for the duration of a with block, waiting for a free one in this thread.
+        """
+
+        with self._cond:
+            self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """
+        Holds one of the limit's slots for the duration of an async with block, waiting for a free one.
+        """
+
+        if self._async_cond is None:
+            self._async_cond = asyncio.Condition()
+
+        async with self._async_cond:
+            await self._async_cond.wait_for(self._try_acquire)
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+
+            async with self._async_cond:
+                self._async_cond.notify_all()
+
+    def summary(self):
+        return f'settled at {self.current} (peak {self.peak}, {self.decreases} decreases)'
@@ -0,0 +1,221 @@
+import argparse
+import hashlib
+import json
+import logging
+import re
+from urllib.parse import parse_qs
+from wsgiref.simple_server import make_server
+import pandas as pd
+from sqlalchemy import text
+from read_cache import TTLCache
+from ticket_stats import get_engine
+
+# Seconds a cached read is served for when the stats aren't updated in between
+CACHE_TTL = 300
+
+# Maximum number of cached reads, one per ticket history plus the latest snapshot of every game
+CACHE_SIZE = 512
+
+# Default number of games returned by the rankings
+RANKINGS_LIMIT = 50
+
+# Default number of days or weeks returned by a ticket's history
+HISTORY_LIMIT = 90
+
+cache = TTLCache(CACHE_SIZE, CACHE_TTL)
+sql_engine = None
+
+
+def get_api_engine():
+    global sql_engine
+
+    if sql_engine is None:
+        sql_engine = get_engine()
+
+    return sql_engine
+
+
+def load_latest(sql_engine=None):
+    """
+    Reads the latest prize snapshot and stats of every game with one query.
+
+    Args:
+        sql_engine: Engine to use, the API's engine if not given.
+
+    Returns:
+        A dictionary with the games ranked by ev_score and the same games by ticket number.
+
+    """
+
+    with (sql_engine or get_api_engine()).connect() as db_connection:
+        df = pd.read_sql(text('SELECT t.ticket_number, t.name, t.price, t.odds, t.pic, p.prize_id, p.time, p.prize, '
+                              's.total_prizes_rem, s.top_prizes_rem, s.ev_score FROM prize p '
+                              'JOIN (SELECT MAX(prize_id) AS prize_id FROM prize GROUP BY ticket_number) latest '
+                              'ON p.prize_id = latest.prize_id '
+                              'JOIN ticket t ON t.ticket_number = p.ticket_number '
+                              'JOIN prize_stats s ON s.prize_id = p.prize_id '
+                              'ORDER BY s.ev_score DESC'), db_connection)
+
+    # Prices are filtered on as numbers, whatever type the driver returns them as
+    df['price'] = pd.to_numeric(df['price'], errors='coerce')
+
+    rankings = json.loads(df.drop_duplicates('prize_id').to_json(orient='records', date_format='iso'))
+
+    for game in rankings:
+        game['prize'] = json.loads(game['prize'])
+
+    return {'rankings': rankings, 'by_number': {game['ticket_number']: game for game in rankings}}
+
+
+def load_history(ticket_number, period):
+    """
+    Reads a ticket's rolled up prize history.
+
+    Args:
+        ticket_number: The game's ticket number.
+        period: day or week.
+
+    Returns:
+        A list of rollup rows, newest first.
+
+    """
+
+    with get_api_engine().connect() as db_connection:
+        df = pd.read_sql(text('SELECT period_start, last_time, total_rem, top_rem, prizes_claimed, top_claimed, '
+                              'claim_rate, top_claim_rate, projected_end FROM prize_rollup '
+                              'WHERE ticket_number = :ticket_number AND period = :period '
+                              'ORDER BY period_start DESC'),
+                         db_connection, params={'ticket_number': ticket_number, 'period': period})
+
+    return json.loads(df.to_json(orient='records', date_format='iso'))
+
+
+def get_rankings(limit=RANKINGS_LIMIT, price=None):
+    """
+    Gets the games with the best ev_score.
+
+    Args:
+        limit: Maximum number of games.
+        price: Only games with this ticket price are returned if given.
+
+    Returns:
+        A list of games.
+
+    """
+
+    rankings = cache.get('latest', load_latest)['rankings']
+
+    if price is not None:
+        rankings = [game for game in rankings if game['price'] == float(price)]
+
+    return rankings[:limit]
+
+
+def get_ticket(ticket_number):
+    """
+    Gets the latest snapshot and stats of one game.
+
+    Returns:
+        A dictionary of the game, or None if there is no such game.
+
+    """
+
+    return cache.get('latest', load_latest)['by_number'].get(ticket_number)
+
+
+def get_history(ticket_number, period='day', limit=HISTORY_LIMIT):
+    """
+    Gets the daily or weekly prize depletion of one game.
+
+    Args:
+        ticket_number: The game's ticket number.
+        period: day or week.
+        limit: Maximum number of periods, newest first.
+
+    Returns:
+        A list of rollup rows.
+
+    """
+
+    history = cache.get(('history', ticket_number, period), lambda: load_history(ticket_number, period))
+
+    return history[:limit]
+
+
+def get_int(query, name, default=None):
+    try:
+        return int(query[name][0])
+    except (KeyError, ValueError):
+        return default
+
+
+def app(environ, start_response):
+    """
+    WSGI app serving the rankings, ticket detail and ticket history as JSON.
+
+    Routes:
+        /rankings?limit=50&price=5
+        /tickets/<ticket_number>
+        /tickets/<ticket_number>/history?period=day&limit=90
+
+    """
+
+    path = environ.get('PATH_INFO', '/').rstrip('/')
+    query = parse_qs(environ.get('QUERY_STRING', ''))
+    status, body = '200 OK', None
+
+    try:
+        if path == '/rankings':
+            body = get_rankings(get_int(query, 'limit', RANKINGS_LIMIT), get_int(query, 'price'))
+
+        elif match := re.fullmatch(r'/tickets/(\d+)', path):
+            body = get_ticket(int(match.group(1)))
+
+        elif match := re.fullmatch(r'/tickets/(\d+)/history', path):
+            period = query.get('period', ['day'])[0]
+
+            if period in ('day', 'week'):
+                body = get_history(int(match.group(1)), period, get_int(query, 'limit', HISTORY_LIMIT))
+
+        if body is None:
+            status, body = '404 Not Found', {'error': 'not found'}
+
+    except Exception as e:
+        logging.exception(e)
+        status, body = '500 Internal Server Error', {'error': 'internal error'}
+
+    content = json.dumps(body).encode()
+
+    if status != '200 OK':
+        start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(content))),
+                                ('Cache-Control', 'no-store')])
+        return [content]
+
+    # Clients revalidate every read, so a stats update is seen as soon as the server's cache is invalidated
+    etag = f'"{hashlib.sha1(content).hexdigest()}"'
+    headers = [('Cache-Control', 'no-cache'), ('ETag', etag)]
+
+    if etag in [tag.strip() for tag in environ.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+        start_response('304 Not Modified', headers)
+        return []
+
+    start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(content)))] + headers)
+
+    return [content]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves the latest ticket stats as JSON.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='port to listen on')
+    args = parser.parse_args()
+
+    logging.basicConfig(filename='lotto_api.log', level=logging.INFO, format='%(asctime)s : %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p')
+
+    with make_server(args.host, args.port, app) as server:
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+import pandas as pd
+import metrics
+from sqlalchemy import text
+from ticket_api import load_latest
+from ticket_stats import get_engine
+
+# Directory the web server serves the stats snapshots from
+EXPORT_DIR = '/var/www/html/stats/'
+
+# Record of the files of the current and previous export
+MANIFEST_NAME = 'export_manifest.json'
+
+
+def write_atomic(path, content):
+    tmp_path = f'{path}.tmp'
+
+    with open(tmp_path, 'wb') as file:
+        file.write(content)
+
+    os.replace(tmp_path, path)
+
+
+def load_manifest(export_dir):
+    path = os.path.join(export_dir, MANIFEST_NAME)
+
+    if not os.path.exists(path):
+        return {'version': 0, 'files': {}, 'previous': []}
+
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        logging.error(f'Unable to read export manifest {path}, writing every file again.\n{e}')
+        return {'version': 0, 'files': {}, 'previous': []}
+
+
+def get_histories(sql_engine):
+    """
+    Reads the daily rollups of every game with one query.
+
+    Args:
+        sql_engine: Engine to use.
+
+    Returns:
+        A DataFrame of prize_rollup rows, newest first.
+
+    """
+
+    with sql_engine.connect() as db_connection:
+        return pd.read_sql(text("SELECT ticket_number, period_start, last_time, total_rem, top_rem, prizes_claimed, "
+                                "top_claimed, claim_rate, top_claim_rate, projected_end FROM prize_rollup "
+                                "WHERE period = 'day' ORDER BY ticket_number, period_start DESC"), db_connection)
+
+
+def emit(export_dir, key, payload, manifest, files):
+    """
+    Writes a gzipped JSON file named after the hash of its content, unless the same content was already exported.
+
+    Args:
+        export_dir: The export directory.
+        key: Name the file is listed under in the index, ex. leaderboard or tickets/1234.
+        payload: The JSON serializable content.
+        manifest: The previous export's manifest.
+        files: Dictionary of key to file name of this export, updated in place.
+
+    Returns:
+        True if a new file was written.
+
+    """
+
+    content = json.dumps(payload, separators=(',', ':'), sort_keys=True).encode()
+    name = f"{key}.{hashlib.sha256(content).hexdigest()[:16]}.json.gz"
+    files[key] = name
+
+    if manifest['files'].get(key) == name and os.path.exists(os.path.join(export_dir, name)):
+        return False
+
+    os.makedirs(os.path.dirname(os.path.join(export_dir, name)), exist_ok=True)
+
+    # A fixed mtime keeps the compressed bytes identical for identical content
+    write_atomic(os.path.join(export_dir, name), gzip.compress(content, mtime=0))
+
+    return True
+
+
+def write_parquet(df, path):
+    """
+    Writes a DataFrame as Parquet for analysis, skipping it if no Parquet engine is installed.
+    """
+
+    try:
+        df.to_parquet(f'{path}.tmp', index=False)
+        os.replace(f'{path}.tmp', path)
+    except ImportError as e:
+        logging.error(f'Unable to write {path}, install pyarrow for Parquet exports.\n{e}')
+
+
+def export(sql_engine, export_dir=EXPORT_DIR):
+    """
+    Exports the leaderboard and every game's history as static files the web tier can serve without the database.
+
+    Each file is named after the hash of its content, so it can be cached forever, and only games whose data changed
+    are written again. index.json lists the current files and is replaced last, so readers always see a complete
+    export. Files of the export before the previous one are removed.
+
+    Args:
+        sql_engine: Engine to use.
+        export_dir: Directory to write to.
+
+    Returns:
+        A dictionary with the export version and the number of files written and unchanged.
+
+    """
+
+    os.makedirs(export_dir, exist_ok=True)
+    manifest = load_manifest(export_dir)
+
+    latest = load_latest(sql_engine)
+    histories = get_histories(sql_engine)
+
+    files = {}
+    stats = {'version': manifest['version'] + 1, 'written': 0, 'unchanged': 0}
+
+    history_records = json.loads(histories.to_json(orient='records', date_format='iso'))
+    by_ticket = {}
+    for record in history_records:
+        by_ticket.setdefault(record.pop('ticket_number'), []).append(record)
+
+    for game in latest['rankings']:
+        written = emit(export_dir, f"tickets/{game['ticket_number']}",
+                       {'ticket': game, 'history': by_ticket.get(game['ticket_number'], [])}, manifest, files)
+        stats['written' if written else 'unchanged'] += 1
+
+    written = emit(export_dir, 'leaderboard', latest['rankings'], manifest, files)
+    stats['written' if written else 'unchanged'] += 1
+
+    if not stats['written'] and files == manifest['files']:
+        logging.info('Export unchanged, nothing written.')
+        stats['version'] = manifest['version']
+        return stats
+
+    leaderboard_df = pd.DataFrame(latest['rankings']).drop(columns='prize', errors='ignore')
+    write_parquet(leaderboard_df, os.path.join(export_dir, 'leaderboard.parquet'))
+    write_parquet(histories, os.path.join(export_dir, 'history.parquet'))
+
+    generated = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    index = {'version': stats['version'], 'generated': generated, 'files': files}
+    write_atomic(os.path.join(export_dir, 'index.json'), json.dumps(index).encode())
+
+    # Readers may still hold the previous index, so only the files of the one before it are removed
+    current = set(files.values())
+    for name in manifest.get('previous', []):
+        if name not in current:
+            try:
+                os.remove(os.path.join(export_dir, name))
+            except FileNotFoundError:
+                pass
+
+    previous = [name for name in manifest['files'].values() if name not in current]
+    write_atomic(os.path.join(export_dir, MANIFEST_NAME),
+                 json.dumps({'version': stats['version'], 'files': files, 'previous': previous}).encode())
+
+    metrics.inc('export_files_written', stats['written'])
+    logging.info(f"Export version {stats['version']}: {stats['written']} files written, "
+                 f"{stats['unchanged']} unchanged.")
+
+    return stats
+
+
+def main(export_dir=EXPORT_DIR):
+    logging.basicConfig(filename='lotto_stats.log', level=logging.INFO, format='%(asctime)s : %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p')
+    logging.info('Started Ticket Export...')
+
+    with metrics.timer('export_seconds'):
+        export(get_engine(), export_dir)
+
+    metrics.write('export')
+    logging.info('Finished Ticket Export.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exports the leaderboard and ticket histories as static files.')
+    parser.add_argument('--export-dir', default=EXPORT_DIR, help='directory the web server serves the files from')
+    args = parser.parse_args()
+
+    main(args.export_dir)
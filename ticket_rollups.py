@@ -0,0 +1,211 @@
+import argparse
+import logging
+import pandas as pd
+import metrics
+import read_cache
+from sqlalchemy import text
+from ticket_stats import get_engine
+
+# Rollup periods and the pandas frequency each one starts on, weeks start on Monday
+PERIODS = {'day': 'D', 'week': 'W-SUN'}
+
+ROLLUP_COLUMNS = ['ticket_number', 'period', 'period_start', 'snapshots', 'last_time', 'total_rem', 'top_rem',
+                  'prizes_claimed', 'top_claimed', 'claim_rate', 'top_claim_rate', 'projected_end']
+
+
+def create_rollup_table(sql_engine):
+    """
+    Creates the prize_rollup table.
+
+    Each row holds a ticket's prizes remaining at the end of a day or week, the prizes claimed since the ticket's
+    previous snapshot before that period, and the claim rate per day they imply.
+
+    Args:
+        sql_engine: Engine to use.
+
+    """
+
+    with sql_engine.begin() as db_connection:
+        db_connection.execute(text('CREATE TABLE IF NOT EXISTS prize_rollup ('
+                                   'ticket_number INT NOT NULL, '
+                                   'period VARCHAR(8) NOT NULL, '
+                                   'period_start DATE NOT NULL, '
+                                   'snapshots INT NOT NULL, '
+                                   'last_time DATETIME NOT NULL, '
+                                   'total_rem BIGINT NOT NULL, '
+                                   'top_rem INT NOT NULL, '
+                                   'prizes_claimed BIGINT NOT NULL, '
+                                   'top_claimed INT NOT NULL, '
+                                   'claim_rate DOUBLE NULL, '
+                                   'top_claim_rate DOUBLE NULL, '
+                                   'projected_end DATETIME NULL, '
+                                   'PRIMARY KEY (ticket_number, period, period_start), '
+                                   'INDEX prize_rollup_period (period, period_start))'))
+
+
+def get_since(sql_engine):
+    """
+    Gets the start of the newest week already rolled up, everything from there on is recalculated.
+
+    Args:
+        sql_engine: Engine to use.
+
+    Returns:
+        The start of the week as a Timestamp, or None if nothing was rolled up yet.
+
+    """
+
+    with sql_engine.connect() as db_connection:
+        since = db_connection.execute(text("SELECT MAX(period_start) FROM prize_rollup WHERE period = 'week'")).scalar()
+
+    return pd.Timestamp(since) if since is not None else None
+
+
+def get_snapshots(sql_engine, since=None):
+    """
+    Gets the prizes remaining of every prize snapshot since a time, plus each ticket's last snapshot before it.
+
+    Args:
+        sql_engine: Engine to use.
+        since: Only snapshots from this time on are returned, every snapshot if not given.
+
+    Returns:
+        A DataFrame with ticket_number, time, total_rem and top_rem columns.
+
+    """
+
+    totals = ('SELECT ticket_number, time, SUM(remaining) AS total_rem, '
+              'SUM(CASE WHEN tier_order = 0 THEN remaining ELSE 0 END) AS top_rem FROM prize_tier ')
+
+    with sql_engine.connect() as db_connection:
+        if since is None:
+            return pd.read_sql(text(totals + 'GROUP BY ticket_number, time'), db_connection)
+
+        params = {'since': since.to_pydatetime()}
+
+        df = pd.read_sql(text(totals + 'WHERE time >= :since GROUP BY ticket_number, time'),
+                         db_connection, params=params)
+
+        # The snapshot each ticket's claims in the first period are measured from
+        baseline = pd.read_sql(text(totals + 'NATURAL JOIN (SELECT ticket_number, MAX(time) AS time FROM prize_tier '
+                                             'WHERE time < :since GROUP BY ticket_number) latest '
+                                             'GROUP BY ticket_number, time'),
+                               db_connection, params=params)
+
+    return pd.concat([baseline, df], ignore_index=True)
+
+
+def get_rollup_df(snapshot_df, since=None):
+    """
+    Rolls prize snapshots up into per-ticket daily and weekly rows.
+
+    Claims in a period are measured from the ticket's last snapshot before the period, or from its first snapshot
+    in the period if it has none.
+
+    Args:
+        snapshot_df: DataFrame with ticket_number, time, total_rem and top_rem columns.
+        since: Periods starting before this time are only used as the baseline of the next period.
+
+    Returns:
+        A DataFrame with the columns of the prize_rollup table.
+
+    """
+
+    df = snapshot_df.assign(time=pd.to_datetime(snapshot_df['time'])).sort_values(['ticket_number', 'time'])
+    rollups = []
+
+    for period, freq in PERIODS.items():
+        period_start = df['time'].dt.to_period(freq).dt.start_time
+
+        groups = df.groupby([df['ticket_number'], period_start.rename('period_start')], sort=True).agg(
+            snapshots=('time', 'size'),
+            first_time=('time', 'first'), last_time=('time', 'last'),
+            first_total=('total_rem', 'first'), total_rem=('total_rem', 'last'),
+            first_top=('top_rem', 'first'), top_rem=('top_rem', 'last'),
+        ).reset_index()
+
+        # The end of each ticket's previous period is the baseline of the next one
+        previous = groups.groupby('ticket_number')[['last_time', 'total_rem', 'top_rem']].shift()
+        base_time = previous['last_time'].fillna(groups['first_time'])
+        base_total = previous['total_rem'].fillna(groups['first_total'])
+        base_top = previous['top_rem'].fillna(groups['first_top'])
+
+        groups['prizes_claimed'] = (base_total - groups['total_rem']).astype('int64')
+        groups['top_claimed'] = (base_top - groups['top_rem']).astype('int64')
+
+        days = (groups['last_time'] - base_time).dt.total_seconds() / 86400
+        groups['claim_rate'] = (groups['prizes_claimed'] / days).where(days > 0)
+        groups['top_claim_rate'] = (groups['top_claimed'] / days).where(days > 0)
+
+        # Day the remaining prizes run out at the current claim rate
+        selling = groups['claim_rate'] > 0
+        groups['projected_end'] = groups['last_time'] + pd.to_timedelta(
+            (groups['total_rem'] / groups['claim_rate']).where(selling), unit='D')
+
+        groups['period'] = period
+
+        if since is not None:
+            groups = groups[groups['period_start'] >= since]
+
+        rollups.append(groups[ROLLUP_COLUMNS])
+
+    return pd.concat(rollups, ignore_index=True)
+
+
+def update_rollups(sql_engine, rebuild=False):
+    """
+    Recalculates the rollups of the newest window, or of the whole prize history.
+
+    Args:
+        sql_engine: Engine to use.
+        rebuild: Whether to recalculate every period.
+
+    Returns:
+        The number of rollup rows written.
+
+    """
+
+    create_rollup_table(sql_engine)
+    since = None if rebuild else get_since(sql_engine)
+
+    with metrics.timer('rollup_seconds'):
+        snapshot_df = get_snapshots(sql_engine, since)
+        rollup_df = get_rollup_df(snapshot_df, since)
+
+    rollup_df['period_start'] = rollup_df['period_start'].dt.date
+
+    # Replace the window's rows in one transaction so readers never see it half written
+    with sql_engine.begin() as db_connection:
+        if since is None:
+            db_connection.execute(text('DELETE FROM prize_rollup'))
+        else:
+            db_connection.execute(text('DELETE FROM prize_rollup WHERE period_start >= :since'),
+                                  {'since': since.date()})
+
+        rollup_df.to_sql('prize_rollup', db_connection, if_exists='append', index=False)
+
+    read_cache.invalidate()
+    metrics.inc('rollup_rows', len(rollup_df))
+    logging.info(f"prize_rollup : {len(rollup_df)} rows written from {len(snapshot_df)} snapshots "
+                 f"({'full history' if since is None else f'since {since.date()}'}).")
+
+    return len(rollup_df)
+
+
+def main(rebuild=False):
+    logging.basicConfig(filename='lotto_stats.log', level=logging.INFO, format='%(asctime)s : %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p')
+    logging.info('Started Ticket Rollups...')
+
+    update_rollups(get_engine(), rebuild)
+
+    metrics.write('rollups')
+    logging.info('Finished Ticket Rollups.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rolls prize snapshots up into daily and weekly depletion rates.')
+    parser.add_argument('--rebuild', action='store_true', help='recalculate every period, not only the newest week')
+    args = parser.parse_args()
+
+    main(args.rebuild)
@@ -1,19 +1,49 @@
+import argparse
 import json
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 from selenium import webdriver
+from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
-from bs4 import BeautifulSoup
+from selenium.webdriver.support.ui import WebDriverWait
+from extract import extract_ticket_hrefs
 import mysql.connector
 import pandas as pd
 import os
 import logging
+from crawl_state import CrawlCheckpoint
+from page_cache import PageCache
+import metrics
+import prize_parser
+from throttle import AdaptiveLimiter, TokenBucket, backoff_delay
 
 logging.basicConfig(filename="lotto.log", level=logging.INFO, format="%(asctime)s : %(message)s",
                     datefmt="%m/%d/%Y %I:%M:%S %p")
 
+# Site the tickets are scraped from
+BASE_URL = "https://www.ohiolottery.com"
+
+# Seconds to wait for a page's data to be rendered before giving up
+PAGE_TIMEOUT = 10
+
+# Page titles the site serves instead of a ticket page when it is rate limiting the crawl
+THROTTLE_TITLES = ('429', 'Too Many Requests', 'Access Denied', 'Service Unavailable')
+
+# Columns of the DataFrame built from the ticket dictionaries returned by get_ticket_info
+TICKET_COLUMNS = ['name', 'ticket_number', 'price', 'odds', 'prize', 'pic', 'time']
+
+# Columns of the new prize snapshots handed to the stats job
+SNAPSHOT_COLUMNS = ['ticket_number', 'prize', 'time']
+
+# Columns of the scraped tickets handed to the image sync
+IMAGE_COLUMNS = ['pic', 'price', 'ticket_number']
+
 
 def get_driver():
     chrome_options = Options()
@@ -29,65 +59,202 @@ def get_driver():
     return driver
 
 
-def get_ticket_hrefs():
+class DriverPool:
+    """
+    A fixed number of long-lived WebDriver instances shared by the scraping workers.
+
+    Drivers are started lazily and recycled after max_pages page loads or after they crash.
+
+    Args:
+        size: Number of Chrome instances in the pool.
+        max_pages: Number of pages a driver loads before it is restarted.
+
+    """
+
+    def __init__(self, size=4, max_pages=50):
+        self.size = size
+        self.max_pages = max_pages
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._recycled = 0
+
+        # Empty slots are filled with a driver the first time they are checked out
+        for _ in range(size):
+            self._idle.put((None, 0))
+
+    @contextmanager
+    def driver(self):
+        """
+        Checks a driver out of the pool for the duration of a with block.
+
+        A WebDriverException raised inside the block marks the driver as crashed so it is replaced.
+
+        """
+
+        driver, pages = self._idle.get()
+        healthy = True
+
+        try:
+            if driver is None:
+                driver = get_driver()
+                with self._lock:
+                    self._started += 1
+
+            yield driver
+
+        except WebDriverException:
+            healthy = False
+            raise
+
+        finally:
+            pages += 1
+
+            if driver is not None and (not healthy or pages >= self.max_pages):
+                self._quit(driver)
+                with self._lock:
+                    self._recycled += 1
+                driver, pages = None, 0
+
+            self._idle.put((driver, pages))
+
+    def close(self):
+        """
+        Quits every idle driver in the pool.
+        """
+
+        while not self._idle.empty():
+            driver, _ = self._idle.get_nowait()
+            if driver is not None:
+                self._quit(driver)
+
+        logging.info(f"Driver pool closed ({self._started} started, {self._recycled} recycled).")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except WebDriverException as e:
+            logging.error(f"Unable to quit driver.\n{e}")
+
+
+def wait_for_elements(driver, css_selector, min_count=1, timeout=PAGE_TIMEOUT):
+    """
+    Waits until the page contains at least min_count elements matching a CSS selector.
+
+    Args:
+        driver: The WebDriver that loaded the page.
+        css_selector: CSS selector of the elements to wait for.
+        min_count: Number of matching elements required for the page to be ready.
+        timeout: Seconds to wait before raising a TimeoutException.
+
+    Returns:
+        The number of seconds spent waiting.
+
+    """
+
+    start = time.perf_counter()
+
+    try:
+        WebDriverWait(driver, timeout).until(
+            lambda d: len(d.find_elements(By.CSS_SELECTOR, css_selector)) >= min_count)
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe('page_wait_seconds', elapsed)
+
+    return elapsed
+
+
+def log_page_wait_times():
+    """
+    Logs the distribution of page readiness waits recorded during this run.
+    """
+
+    waits = metrics.get_histogram('page_wait_seconds').summary()
+
+    if not waits['count']:
+        return
+
+    logging.info(f"Page waits: {waits['count']} pages, p50 {waits['p50']:.2f}s, p95 {waits['p95']:.2f}s, "
+                 f"max {waits['max']:.2f}s, total {waits['sum']:.1f}s")
+
+
+def log_concurrency(limiter):
+    """
+    Logs and records the number of pages loaded at once that the crawl settled on.
+    """
+
+    logging.info(f"Scrape concurrency {limiter.summary()}.")
+    metrics.set_gauge('scrape_concurrency', limiter.current)
+
+
+def get_ticket_hrefs(driver=None, timeout=PAGE_TIMEOUT):
     """
     Gets the href for every ticket.
 
+    Args:
+        driver: WebDriver to use. A new driver is started and closed if none is given.
+        timeout: Seconds to wait for the ticket list to load.
+
     Returns:
         A list of hrefs for every available ticket.
     """
 
     logging.info("Getting ticket URLS...")
 
+    own_driver = driver is None
+    if own_driver:
+        driver = get_driver()
+
     # Get web page and wait for data to load
-    driver = get_driver()
-    driver.get("https://www.ohiolottery.com/games/scratch-offs")
-    time.sleep(2)
+    with metrics.timer('page_fetch_seconds'):
+        driver.get(f"{BASE_URL}/games/scratch-offs")
 
     ticket_hrefs = []
     try:
-        tickets = driver.find_elements(By.CLASS_NAME, "igLandListItem")
-
-        for ticket in tickets:
-            # Convert to HTML
-            html_cont = ticket.get_attribute("innerHTML")
-
-            # Parse the HTML content
-            soup = BeautifulSoup(html_cont, "html.parser")
-
-            # Find the <a> tag
-            a_tag = soup.find("a")
-            href_value = a_tag.get("href")
+        wait_for_elements(driver, ".igLandListItem", timeout=timeout)
 
-            ticket_hrefs.append(href_value)
+        # Scan the rendered page once for the <a> tag in every list item
+        ticket_hrefs = extract_ticket_hrefs(driver.page_source)
 
     except Exception as e:
         logging.error("Unable to collect ticket URLS.")
         logging.error(e)
 
     finally:
-        driver.close()
-        return ticket_hrefs
+        if own_driver:
+            driver.close()
 
+    return ticket_hrefs
 
-def get_ticket_info(href):
+
+def get_ticket_info(href, driver=None, timeout=PAGE_TIMEOUT):
     """
       Gets the available data for a scratch off ticket.
 
       Args:
           href: The href of the ticket.
+          driver: WebDriver to use. A new driver is started and closed if none is given.
+          timeout: Seconds to wait for the prize table to load.
 
       Returns:
-           A list containing the ticket's available data.
+           A tuple of a dictionary containing the ticket's available data, or None if it could not be collected, and
+           the outcome of the page load: ok, timeout, throttled or parse_error. Other WebDriverExceptions, like a
+           crashed session, are raised so the driver can be replaced.
 
       """
 
     logging.info(f"Getting ticket information ({href})")
 
-    # Get web page and wait for data to load
-    driver = get_driver()
-    driver.get(f"https://www.ohiolottery.com{href}")
-    time.sleep(2)
+    own_driver = driver is None
+    if own_driver:
+        driver = get_driver()
 
     # Create a dictionary with all fields to collect for a ticket
     ticket_data = {
@@ -96,10 +263,20 @@ def get_ticket_info(href):
         "ticket_price": "",
         "ticket_odds": "",
         "ticket_prize": "",
+        "ticket_pic": "",
         "now": ""
     }
 
     try:
+        # Get web page and wait for data to load
+        with metrics.timer('page_fetch_seconds'):
+            driver.get(f"{BASE_URL}{href}")
+        metrics.inc('pages_fetched')
+
+        # Prize table has two header rows followed by one row per prize tier
+        wait_for_elements(driver, ".tbl_PrizesRemaining .grid-x", min_count=3, timeout=timeout)
+        parse_start = time.perf_counter()
+
         # Ticket Name
         ticket_data["ticket_name"] = driver.find_element(By.CSS_SELECTOR, "H1").text
 
@@ -134,46 +311,489 @@ def get_ticket_info(href):
         ticket_prize = json.dumps(dict(zip(ticket_tier, ticket_rem)))
         ticket_data["ticket_prize"] = ticket_prize
 
+        # Ticket Picture, linked from the background image of the ticket
+        ticket_img = driver.find_elements(By.CLASS_NAME, "igTicketImg")
+        if ticket_img:
+            ticket_pic = ticket_img[0].get_attribute("style")
+            ticket_pic = ticket_pic[ticket_pic.find("(") + 1:ticket_pic.find(")")].strip("\"'")
+            ticket_data["ticket_pic"] = f"{BASE_URL}{ticket_pic}"
+
         # Collection DateTime
         ticket_data["now"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    except Exception as e:
-        logging.error(f"Unable to fetch ticket data: {href}\n{e}")
-        return None
+        metrics.observe('parse_seconds', time.perf_counter() - parse_start)
+
+    # The page timed out or didn't have the expected layout, the driver itself is still usable
+    except TimeoutException as e:
+        outcome = 'throttled' if any(title in driver.title for title in THROTTLE_TITLES) else 'timeout'
+        logging.error(f"Unable to fetch ticket data ({outcome}): {href}\n{e}")
+        metrics.inc('page_errors')
+        return None, outcome
+
+    except (NoSuchElementException, IndexError, ValueError) as e:
+        logging.error(f"Unable to parse ticket data: {href}\n{e}")
+        metrics.inc('page_errors')
+        return None, 'parse_error'
 
     finally:
-        driver.close()
-        return ticket_data
+        if own_driver:
+            driver.close()
+
+    return ticket_data, 'ok'
 
 
-def get_ticket_df(num_tickets=None):
+def get_pooled_ticket_info(pool, href, retries=1, timeout=PAGE_TIMEOUT, limiter=None, bucket=None):
     """
-    Returns a Dataframe of every ticket's information.
+    Gets the available data for a ticket using a driver from the pool.
 
     Args:
-        num_tickets: Number of tickets to add to the DataFrame.
+        pool: The DriverPool to check a driver out of.
+        href: The href of the ticket.
+        retries: Number of times to retry after a timeout, a throttled page or a driver crash.
+        timeout: Seconds to wait for the prize table to load.
+        limiter: Optional AdaptiveLimiter deciding how many pages load at once.
+        bucket: Optional TokenBucket capping the rate pages are loaded at.
 
     Returns:
-        A DataFrame containing information for every ticket
+        A dictionary containing the ticket's available data, or None if it could not be collected.
 
     """
 
-    data = []
-    ticket_hrefs = get_ticket_hrefs()
+    for attempt in range(1, retries + 2):
+        if bucket:
+            bucket.wait()
 
-    for i, href in enumerate(ticket_hrefs):
-        if num_tickets and i >= num_tickets:
-            break
+        with limiter.slot() if limiter else nullcontext():
+            start = time.perf_counter()
 
-        try:
-            ticket_data = get_ticket_info(href)
-            data.append(ticket_data.values())
+            try:
+                with pool.driver() as driver:
+                    ticket_data, outcome = get_ticket_info(href, driver, timeout)
+
+            except WebDriverException as e:
+                logging.error(f"Driver crashed while fetching {href} (attempt {attempt}).\n{e}")
+                ticket_data, outcome = None, 'crashed'
+
+            # Only throttled and timed out pages mean the site is overloaded, a malformed page doesn't
+            if limiter:
+                limiter.record(time.perf_counter() - start, throttled=outcome in ('throttled', 'timeout'))
+
+        # Loading a malformed page again gives the same result
+        if outcome in ('ok', 'parse_error'):
+            return ticket_data
+
+        if attempt <= retries:
+            time.sleep(backoff_delay(attempt))
+
+    return None
+
+
+def stream_tickets(num_tickets=None, pool_size=4, max_pages=50, timeout=PAGE_TIMEOUT, cache=None,
+                   batch_size=25, flush_interval=5.0, sql_engine=None, rate=None, checkpoint=None):
+    """
+    Scrapes every ticket and writes them to the database in micro-batches while the crawl is still running.
+
+    Scraping workers put tickets on a bounded queue that a single writer thread drains, so scraping and
+    database I/O overlap. Scraped tickets aren't kept once written, only the new prize snapshots and the columns
+    the image sync reads, so later jobs can use them without reading them back.
+
+    Args:
+        num_tickets: Number of tickets to scrape.
+        pool_size: Number of Chrome instances scraping tickets in parallel.
+        max_pages: Number of pages a Chrome instance loads before it is restarted.
+        timeout: Seconds to wait for each page's data to load.
+        cache: Optional PageCache used to skip tickets whose prize table has not changed since the last run.
+        batch_size: Maximum number of tickets written per flush.
+        flush_interval: Maximum number of seconds a scraped ticket waits before it is written.
+        sql_engine: Optional pooled engine the writer borrows its connection from, a new connection is opened if none
+            is given.
+        rate: Maximum number of pages loaded per second.
+        checkpoint: Optional CrawlCheckpoint. Tickets written by an interrupted run in the same window are skipped
+            and the ones that failed are retried first.
+
+    Returns:
+        A summary dictionary like write_tickets returns. Tickets written by an interrupted run are included in the
+        tickets count and the images. Their prize snapshots aren't known, so snapshots is None after a resumed run
+        and the stats are updated from the database instead.
+
+    """
+
+    ticket_queue = queue.Queue(maxsize=batch_size * 2)
+    summaries = []
+    resumed = []
+    listing = set()
+
+    # Start below the pool size and let the limiter find how many pages the site keeps up with
+    limiter = AdaptiveLimiter(min(2, pool_size), maximum=pool_size)
+    bucket = TokenBucket(rate)
+
+    writer = threading.Thread(target=lambda: summaries.append(
+        write_tickets(ticket_queue, batch_size, flush_interval, cache, sql_engine, checkpoint)), name="ticket-writer")
+    writer.start()
+
+    def put(item):
+        # Blocks while the writer is behind, but gives up if the writer has died
+        while True:
+            try:
+                ticket_queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                if not writer.is_alive():
+                    raise RuntimeError("Ticket writer stopped, aborting crawl.")
+
+    def scrape(href):
+        # Don't load any more pages once their results can't be written
+        if not writer.is_alive():
+            raise RuntimeError("Ticket writer stopped, aborting crawl.")
+
+        ticket_data = get_pooled_ticket_info(pool, href, timeout=timeout, limiter=limiter, bucket=bucket)
+
+        if ticket_data is None:
+            logging.error(f"Unable to scrape ticket: {href}")
+            if checkpoint:
+                checkpoint.mark_failed(href)
+            return
+
+        put((href, ticket_data))
+
+    try:
+        with DriverPool(pool_size, max_pages) as pool:
+            with pool.driver() as driver:
+                ticket_hrefs = get_ticket_hrefs(driver, timeout)
+
+            if num_tickets:
+                ticket_hrefs = ticket_hrefs[:num_tickets]
+
+            listing = set(ticket_hrefs)
+
+            if checkpoint:
+                resumed = [ticket_data for href, ticket_data in checkpoint.done.items() if href in listing]
+                ticket_hrefs = checkpoint.pending(ticket_hrefs)
+
+            with ThreadPoolExecutor(max_workers=pool_size) as executor:
+                futures = [executor.submit(scrape, href) for href in ticket_hrefs]
+
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    # Drop the tickets that haven't started instead of crawling them for nothing
+                    executor.shutdown(cancel_futures=True)
+                    raise
+
+    finally:
+        if writer.is_alive():
+            put(None)
+        writer.join()
+
+    # An empty listing means the listing page failed, keep the progress for the next run
+    if checkpoint and listing:
+        checkpoint.finish()
+
+    log_page_wait_times()
+    log_concurrency(limiter)
+
+    summary = summaries[0] if summaries else {'tickets': 0, 'failed': 0,
+                                              'snapshots': pd.DataFrame(columns=SNAPSHOT_COLUMNS),
+                                              'images': pd.DataFrame(columns=IMAGE_COLUMNS)}
+
+    if resumed:
+        logging.info(f"{len(resumed)} tickets were written by the interrupted run.")
+        resumed_df = pd.DataFrame([ticket_data.values() for ticket_data in resumed], columns=TICKET_COLUMNS)
+        summary['tickets'] += len(resumed_df)
+        summary['images'] = pd.concat([resumed_df[IMAGE_COLUMNS], summary['images']], ignore_index=True)
+        summary['snapshots'] = None
+
+    return summary
+
+
+def write_tickets(ticket_queue, batch_size=25, flush_interval=5.0, cache=None, sql_engine=None, checkpoint=None):
+    """
+    Drains scraped tickets from a queue and flushes them to the database in micro-batches until None is received.
+
+    Args:
+        ticket_queue: Queue of (href, ticket data) tuples produced by the scraping workers.
+        batch_size: Maximum number of tickets written per flush.
+        flush_interval: Maximum number of seconds a ticket waits in the batch before it is written.
+        cache: Optional PageCache used to skip tickets whose prize table has not changed since the last run.
+        sql_engine: Optional pooled engine to borrow the connection from.
+        checkpoint: Optional CrawlCheckpoint the tickets are recorded in once they are written.
+
+    Returns:
+        A summary dictionary with the number of tickets scraped and failed, the DataFrame of new prize snapshots
+        written and the DataFrame of the scraped tickets' image columns.
+
+    """
+
+    conn = sql_engine.raw_connection() if sql_engine else get_conn()
+    batch = []
+    scraped = 0
+    failed = 0
+    images = []
+    snapshots = []
+    last_flush = time.monotonic()
+    done = False
+
+    try:
+        # New prize snapshots are only kept with their tiers, so the table has to exist before anything is written
+        create_tier_table(conn)
+
+        while not done:
+            try:
+                item = ticket_queue.get(timeout=flush_interval)
+                if item is None:
+                    done = True
+                else:
+                    batch.append(item)
+            except queue.Empty:
+                pass
+
+            if batch and (done or len(batch) >= batch_size or time.monotonic() - last_flush >= flush_interval):
+                scraped += len(batch)
+                images.append(pd.DataFrame([[ticket_data['ticket_pic'], ticket_data['ticket_price'],
+                                             ticket_data['ticket_number']] for href, ticket_data in batch],
+                                           columns=IMAGE_COLUMNS))
+
+                try:
+                    snapshot_df, failed_hrefs = flush_tickets(batch, conn, cache)
+                    snapshots.append(snapshot_df)
+                    failed += len(failed_hrefs)
+
+                    if checkpoint:
+                        checkpoint.mark_done([item for item in batch if item[0] not in failed_hrefs])
+                        for href in failed_hrefs:
+                            checkpoint.mark_failed(href)
+                        checkpoint.save()
+
+                except Exception as e:
+                    failed += len(batch)
+                    logging.error(f"Unable to write {len(batch)} tickets.")
+                    logging.error(e)
+
+                batch = []
+                last_flush = time.monotonic()
+
+    finally:
+        conn.close()
+
+    return {'tickets': scraped, 'failed': failed,
+            'snapshots': pd.concat(snapshots, ignore_index=True) if snapshots else
+            pd.DataFrame(columns=SNAPSHOT_COLUMNS),
+            'images': pd.concat(images, ignore_index=True) if images else pd.DataFrame(columns=IMAGE_COLUMNS)}
+
+
+def flush_tickets(batch, conn, cache=None):
+    """
+    Writes a micro-batch of scraped tickets to the ticket and prize tables.
+
+    Only prize tables that differ from the last stored snapshot of their ticket are inserted as new versions,
+    unchanged ones just have the last_seen time of that snapshot moved forward.
+
+    Args:
+        batch: List of (href, ticket data) tuples.
+        conn: The database connection to write with.
+        cache: Optional PageCache used to skip tickets whose prize table has not changed since the last run. The
+            hashes of the batch are only stored in it once their tickets are written.
+
+    Returns:
+        A tuple of the DataFrame of the new prize snapshots written and the set of hrefs that could not be written.
+
+    """
+
+    df = pd.DataFrame([ticket_data.values() for href, ticket_data in batch], columns=TICKET_COLUMNS)
+    urls = [f"{BASE_URL}{href}" for href, ticket_data in batch]
+    hashes = [PageCache.prize_hash(ticket_data["ticket_prize"]) for href, ticket_data in batch]
+
+    changed = [cache is None or cache.hash_changed(url, prize_hash) for url, prize_hash in zip(urls, hashes)]
+    unchanged_df = df[[not c for c in changed]]
+    df = df[changed]
+
+    ticket_df = df[['ticket_number', 'name', 'price', 'odds', 'pic']].copy()
+    prize_df = df[['ticket_number', 'prize', 'time']].copy()
+
+    # Drop prize tables that match the ticket's latest snapshot in the database
+    prize_df, db_unchanged_df = split_unchanged_prizes(prize_df, conn)
+    prize_df['last_seen'] = prize_df['time']
+
+    # Insert data into ticket table
+    failed_tickets = insert_df(ticket_df, 'ticket', ignore=True, conn=conn)
+
+    # The stats job joins prize rows to their ticket, a prize row without one would never get stats
+    prize_df = prize_df.drop(failed_tickets.index, errors='ignore')
 
-        except Exception as e:
-            logging.error("Unable to return ticket DataFrame.")
-            logging.error(e)
+    # Insert data into the prize table
+    failed_prizes = insert_df(prize_df, 'prize', conn=conn)
+    prize_df = prize_df.drop(failed_prizes.index)
 
-    return pd.DataFrame(data, columns=['name', 'ticket_number', 'price', 'odds', 'prize', 'time'])
+    # Insert the typed prize tiers of each new snapshot
+    failed_tiers = insert_df(get_tier_df(prize_df), 'prize_tier', ignore=True, conn=conn)
+
+    # A stored snapshot hides the same prize table from the next run, so it is only kept with all of its tiers
+    failed_keys = set(zip(failed_tiers['ticket_number'], failed_tiers['time']))
+    incomplete_df = prize_df[[key in failed_keys for key in zip(prize_df['ticket_number'], prize_df['time'])]]
+    delete_prizes(incomplete_df, conn)
+    prize_df = prize_df.drop(incomplete_df.index)
+
+    # Record that the unchanged snapshots are still current
+    touch_prizes(pd.concat([unchanged_df[['ticket_number', 'time']], db_unchanged_df[['ticket_number', 'time']]]),
+                 conn)
+
+    # Rows keep their position in the batch as index through every split
+    failed = set(failed_tickets.index) | set(failed_prizes.index) | set(incomplete_df.index)
+
+    # Only remember prize tables once they are stored, so tickets that failed are written again by the next run
+    if cache:
+        for position, (url, prize_hash) in enumerate(zip(urls, hashes)):
+            if changed[position] and position not in failed:
+                cache.set_prize_hash(url, prize_hash)
+        cache.save()
+
+    return df.loc[prize_df.index, SNAPSHOT_COLUMNS], {batch[position][0] for position in failed}
+
+
+def split_unchanged_prizes(prize_df, conn):
+    """
+    Splits scraped prize tables into ones that changed and ones identical to their ticket's latest stored snapshot.
+
+    Args:
+        prize_df: DataFrame with ticket_number, prize and time columns.
+        conn: The database connection to read with.
+
+    Returns:
+        A tuple of the DataFrame of changed prize tables and the DataFrame of unchanged ones.
+
+    """
+
+    if prize_df.empty:
+        return prize_df, prize_df
+
+    ticket_numbers = prize_df['ticket_number'].unique().tolist()
+
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT p.ticket_number, p.prize FROM prize p '
+                   f'JOIN (SELECT MAX(prize_id) AS prize_id FROM prize '
+                   f'WHERE ticket_number IN ({", ".join(["%s" for _ in ticket_numbers])}) '
+                   f'GROUP BY ticket_number) latest ON p.prize_id = latest.prize_id',
+                   ticket_numbers)
+    latest = {str(ticket_number): json.loads(prize) for ticket_number, prize in cursor.fetchall()}
+    cursor.close()
+
+    unchanged = [latest.get(str(ticket_number)) == json.loads(prize)
+                 for ticket_number, prize in zip(prize_df['ticket_number'], prize_df['prize'])]
+    changed = [not u for u in unchanged]
+
+    return prize_df[changed].copy(), prize_df[unchanged].copy()
+
+
+def create_tier_table(conn):
+    """
+    Creates the normalized prize_tier table.
+
+    Args:
+        conn: The database connection.
+
+    """
+
+    cursor = conn.cursor()
+    cursor.execute('CREATE TABLE IF NOT EXISTS prize_tier ('
+                   'ticket_number INT NOT NULL, '
+                   'time DATETIME NOT NULL, '
+                   'tier_order SMALLINT NOT NULL, '
+                   'tier_label VARCHAR(64) NOT NULL, '
+                   'prize_value DOUBLE NOT NULL, '
+                   'remaining INT NOT NULL, '
+                   'PRIMARY KEY (ticket_number, time, tier_order), '
+                   'INDEX prize_tier_time (time))')
+    conn.commit()
+    cursor.close()
+
+
+def get_tier_df(prize_df):
+    """
+    Splits prize tables into one typed row per prize tier.
+
+    Args:
+        prize_df: DataFrame with ticket_number, prize and time columns.
+
+    Returns:
+        A DataFrame with ticket_number, time, tier_order, tier_label, prize_value and remaining columns.
+
+    """
+
+    tiers = []
+
+    for ticket_number, prize, collected in zip(prize_df['ticket_number'], prize_df['prize'], prize_df['time']):
+        for tier_order, (tier_label, remaining) in enumerate(json.loads(prize).items()):
+            tiers.append([ticket_number, collected, tier_order, tier_label, int(remaining.replace(',', ''))])
+
+    tier_df = pd.DataFrame(tiers, columns=['ticket_number', 'time', 'tier_order', 'tier_label', 'remaining'])
+
+    # Parse tier labels into dollar values once, at ingest
+    tier_df.insert(4, 'prize_value', prize_parser.parse_prize_amounts(tier_df['tier_label'].tolist()))
+
+    return tier_df
+
+
+def delete_prizes(df, conn):
+    """
+    Deletes prize snapshots and their tiers, used for snapshots whose tiers couldn't all be written so the next run
+    writes them again.
+
+    Args:
+        df: DataFrame with the ticket_number and time of each snapshot.
+        conn: The database connection to write with.
+
+    """
+
+    if df.empty:
+        return
+
+    cursor = conn.cursor()
+    rows = df[['ticket_number', 'time']].values.tolist()
+
+    try:
+        cursor.executemany('DELETE FROM prize_tier WHERE ticket_number = %s AND time = %s', rows)
+        cursor.executemany('DELETE FROM prize WHERE ticket_number = %s AND time = %s', rows)
+        conn.commit()
+        logging.info(f'prize : {len(df)} snapshots with missing tiers removed.')
+
+    except mysql.connector.Error as err:
+        conn.rollback()
+        logging.error(err)
+
+    finally:
+        cursor.close()
+
+
+def touch_prizes(df, conn):
+    """
+    Moves the last_seen time of each ticket's latest prize snapshot forward.
+
+    Args:
+        df: DataFrame with the ticket_number and time the snapshot was observed again.
+        conn: The database connection to write with.
+
+    """
+
+    if df.empty:
+        return
+
+    cursor = conn.cursor()
+
+    try:
+        cursor.executemany('UPDATE prize p JOIN (SELECT MAX(prize_id) AS prize_id FROM prize '
+                           'WHERE ticket_number = %s) latest ON p.prize_id = latest.prize_id '
+                           'SET p.last_seen = %s',
+                           df[['ticket_number', 'time']].values.tolist())
+        conn.commit()
+        logging.info(f'prize : {len(df)} unchanged snapshots touched.')
+
+    except mysql.connector.Error as err:
+        conn.rollback()
+        logging.error(err)
+
+    finally:
+        cursor.close()
 
 
 def get_conn():
@@ -187,62 +807,99 @@ def get_conn():
     return conn
 
 
-def insert_df(df, table_name, ignore=False):
+def insert_df(df, table_name, ignore=False, chunk_size=500, conn=None, placeholder='%s'):
     """
     Connects to and inserts a DataFrame into the database.
 
+    Rows are written with one multi-row INSERT and one commit per chunk. If a chunk fails it is
+    retried row by row so a single bad row doesn't drop the rest of its chunk.
+
     Args:
         df: The DataFrame to insert.
         table_name: The table to insert into.
         ignore: Whether to ignore existing records in table when inserting.
+        chunk_size: Number of rows written per INSERT statement and commit.
+        conn: Connection to reuse. A new connection is opened and closed if none is given.
+        placeholder: Parameter marker of the connection's driver.
+
+    Returns:
+        A DataFrame of the rows that could not be inserted.
 
     """
 
-    conn = get_conn()
-    cursor = conn.cursor(prepared=True)
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
+
+    cursor = conn.cursor()
     rows_affected = 0
+    failed = []
+    start = time.perf_counter()
 
-    query = (f'INSERT {"IGNORE " if ignore else ""} '
+    query = (f'INSERT {"IGNORE " if ignore else ""}'
              f'INTO {table_name}({", ".join(df.columns)}) '
-             f'VALUES({", ".join(["? " for _ in df.columns])})')
+             f'VALUES({", ".join([placeholder for _ in df.columns])})')
+
+    rows = df.to_dict(orient='split')['data']
+
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
 
-    for x in df.to_dict(orient='split')['data']:
         try:
-            # Insert new data
-            cursor.execute(query, x)
+            # Insert new data as a single multi-row statement
+            with metrics.timer('db_insert_seconds'):
+                cursor.executemany(query, chunk)
+                conn.commit()
             rows_affected += cursor.rowcount
+
         except mysql.connector.Error as err:
+            conn.rollback()
+            logging.error(f'{table_name} : chunk starting at row {i} failed, retrying rows individually.')
             logging.error(err)
 
-    # Commit data to database
-    conn.commit()
+            for j, x in enumerate(chunk, i):
+                try:
+                    cursor.execute(query, x)
+                    conn.commit()
+                    rows_affected += cursor.rowcount
+                except mysql.connector.Error as row_err:
+                    conn.rollback()
+                    failed.append(j)
+                    logging.error(f'{table_name} : {row_err} {x}')
+
+    elapsed = time.perf_counter() - start
+    metrics.inc('rows_inserted', rows_affected)
+    metrics.inc('rows_failed', len(failed))
 
-    logging.info(f'{table_name} : {rows_affected} rows successfully updated.')
+    logging.info(f'{table_name} : {rows_affected} rows successfully updated, {len(failed)} failed '
+                 f'({len(rows) / elapsed if elapsed else 0:.0f} rows/sec).')
 
     cursor.close()
-    conn.close()
+    if own_conn:
+        conn.close()
 
+    return df.iloc[failed]
 
-def main():
+
+def main(fresh=False):
     logging.info("Started scraping...")
 
     try:
-        df = get_ticket_df()
-
-        ticket_df = df[['ticket_number', 'name', 'price', 'odds', 'pic']].copy()
-        prize_df = df[['ticket_number', 'prize', 'time']].copy()
-
-        # Insert data into ticket table
-        insert_df(ticket_df, 'ticket', ignore=True)
-
-        # Insert data into the prize table
-        insert_df(prize_df, 'prize')
+        summary = stream_tickets(cache=PageCache(), checkpoint=CrawlCheckpoint(fresh=fresh))
+        snapshots = 'unknown' if summary['snapshots'] is None else len(summary['snapshots'])
+        logging.info(f"{summary['tickets']} tickets scraped, {snapshots} new prize snapshots written, "
+                     f"{summary['failed']} failed.")
 
     except Exception as e:
         logging.error(e)
 
+    metrics.write('scrape')
     logging.info("Finished scraping.")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Scrapes every scratch off ticket into the database.")
+    parser.add_argument("--fresh", action="store_true", help="ignore the progress of an interrupted crawl")
+    args = parser.parse_args()
+
+    main(args.fresh)
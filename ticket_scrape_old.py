@@ -1,5 +1,6 @@
+import asyncio
+import time
 from datetime import datetime
-from bs4 import BeautifulSoup
 from urllib.request import Request, urlopen
 import urllib.request
 import urllib.error
@@ -8,6 +9,13 @@ import logging
 import json
 import mysql.connector
 import os
+import fetch
+from extract import extract_ticket, extract_ticket_hrefs
+from page_cache import PageCache
+import metrics
+
+# Site the tickets are scraped from
+BASE_URL = 'https://www.ohiolottery.com'
 
 
 def get_ticket_urls():
@@ -21,11 +29,11 @@ def get_ticket_urls():
     logging.info('Collecting ticket URLs...')
 
     # base url to all scratch off games
-    url = 'https://www.ohiolottery.com/games/scratch-offs'
+    url = BASE_URL + '/games/scratch-offs'
 
     try:
         req = Request(
-            url='https://www.ohiolottery.com/games/scratch-offs',
+            url=url,
             headers={'User-Agent': 'Mozilla/5.0'}
         )
 
@@ -33,14 +41,11 @@ def get_ticket_urls():
         request = urllib.request.urlopen(req)
         content = request.read()
 
-        # html format that is parsable
-        page = BeautifulSoup(content, 'html.parser')
-
         # list of every ticket's url
         ticket_urls = []
 
-        for ticket in page.find_all(class_='igLandListItem'):
-            ticket_urls.append('https://www.ohiolottery.com/' + ticket.find('a')['href'])
+        for href in extract_ticket_hrefs(content):
+            ticket_urls.append(BASE_URL + '/' + href)
 
         return ticket_urls
 
@@ -49,31 +54,69 @@ def get_ticket_urls():
         print(e)
 
 
-def get_ticket(url):
+def get_ticket(url, cache=None):
     """
     Gets the available data for a ticket given the URL.
 
     Args:
         url: The url of the ticket.
+        cache: Optional PageCache used to skip tickets whose page or prize table has not changed.
 
     Returns:
-         A list containing the ticket's available data.
+         A list containing the ticket's available data, or None if the ticket has not changed.
 
     """
 
+    req = Request(url=url, headers=cache.request_headers(url) if cache else {})
+
     # download url as html
-    content = urllib.request.urlopen(url).read()
+    try:
+        with metrics.timer('page_fetch_seconds'):
+            response = urllib.request.urlopen(req)
+            content = response.read()
+        metrics.inc('pages_fetched')
+    except urllib.error.HTTPError as err:
+        if err.code == 304 and cache:
+            cache.not_modified(url)
+            return None
+        metrics.inc('page_errors')
+        raise
+
+    if cache:
+        cache.set_validators(url, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+    ticket = parse_ticket(content, url)
 
-    # html format that is able to be parsed
-    page = BeautifulSoup(content, 'html.parser')
+    if cache and not cache.prize_changed(url, ticket[4]):
+        return None
+
+    return ticket
+
+
+def parse_ticket(content, url):
+    """
+    Parses the available data for a ticket from its downloaded page.
+
+    Args:
+        content: The HTML of the ticket's page.
+        url: The url of the ticket.
+
+    Returns:
+         A list containing the ticket's available data.
+
+    """
+
+    # pull only the fields used below out of the html
+    with metrics.timer('parse_seconds'):
+        page = extract_ticket(content)
 
     # time data was scraped
     now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
     # collect information about the ticket
-    ticket_name = page.find('h1').text.strip()
+    ticket_name = page['name'].strip()
 
-    ticket_number = page.find('span', {'class': 'number'}).text.strip('#')
+    ticket_number = page['number'].strip('#')
 
     ticket_price = url.split('/')[6].strip('$')
     if ticket_price == '20DollarGames':
@@ -83,38 +126,33 @@ def get_ticket(url):
     ticket_price = ticket_price.split('-')[0]
 
     try:
-        ticket_odds = page.find(class_='odds').text.strip('Overall odds of winning: ').split()[2]
+        ticket_odds = page['odds'].strip('Overall odds of winning: ').split()[2]
         ticket_odds = pd.to_numeric(ticket_odds)
     except IndexError:
         ticket_odds = 0.0   # no info available
 
-    ticket_tier = []    # ticket prize amounts
-    ticket_rem = []     # ticket prizes remaining
-
-    for game in page.find_all(True, {'class': ['tpdPrizeCell', 'tpdRemainCell']}):
-        if game['class'] == ['tpdPrizeCell']:
-            ticket_tier.append(game.text.strip())
-        else:
-            ticket_rem.append(game.text.strip())
+    ticket_tier = page['tiers']         # ticket prize amounts
+    ticket_rem = page['remaining']      # ticket prizes remaining
 
     # prize table for the ticket
     ticket_prize = json.dumps(dict(zip(ticket_tier, ticket_rem)))
 
     # url to ticket's image
-    ticket_pic = page.find(class_='igTicketImg')['style']
-    ticket_pic = 'https://www.ohiolottery.com' + ticket_pic[ticket_pic.find('(') + 1:ticket_pic.find(')')]
+    ticket_pic = page['pic_style']
+    ticket_pic = BASE_URL + ticket_pic[ticket_pic.find('(') + 1:ticket_pic.find(')')]
 
     # add ticket information to log
     logging.info([ticket_name, ticket_number, ticket_price])
     return [ticket_name, ticket_number, ticket_price, ticket_odds, ticket_prize, ticket_pic, now]
 
 
-def get_tickets_df(num_tickets=None):
+def get_tickets_df(num_tickets=None, cache=None):
     """
     Returns a Dataframe of every ticket's information.
 
     Args:
         num_tickets: Number of tickets to add to the DataFrame.
+        cache: Optional PageCache used to leave out tickets that have not changed since the last run.
 
     Returns:
         A DataFrame containing every tickets information.
@@ -129,8 +167,49 @@ def get_tickets_df(num_tickets=None):
             break
 
         try:
-            data.append(get_ticket(url))
-        except urllib.error.HTTPERROR as err:
+            ticket = get_ticket(url, cache)
+            if ticket is not None:
+                data.append(ticket)
+        except urllib.error.HTTPError as err:
+            logging.error(err)
+
+    return pd.DataFrame(data, columns=['name', 'ticket_number', 'price', 'odds', 'prize', 'pic', 'time'])
+
+
+def get_tickets_df_async(num_tickets=None, concurrency=20, per_host=8, rate=10.0, cache=None):
+    """
+    Returns a Dataframe of every ticket's information, downloading the ticket pages concurrently.
+
+    Args:
+        num_tickets: Number of tickets to add to the DataFrame.
+        concurrency: Maximum number of open connections.
+        per_host: Maximum number of open connections to a single host.
+        rate: Maximum number of requests started per second.
+        cache: Optional PageCache used to leave out tickets that have not changed since the last run.
+
+    Returns:
+        A DataFrame containing every tickets information.
+
+    """
+
+    data = []
+    ticket_urls = get_ticket_urls()
+
+    if num_tickets:
+        ticket_urls = ticket_urls[:num_tickets]
+
+    pages = asyncio.run(fetch.fetch_pages(ticket_urls, concurrency, per_host, rate, cache=cache))
+
+    for url, content in pages:
+        if not content:
+            continue
+
+        try:
+            ticket = parse_ticket(content, url)
+            if cache is None or cache.prize_changed(url, ticket[4]):
+                data.append(ticket)
+        except (AttributeError, KeyError, TypeError) as err:
+            logging.error(f'Unable to parse ticket: {url}')
             logging.error(err)
 
     return pd.DataFrame(data, columns=['name', 'ticket_number', 'price', 'odds', 'prize', 'pic', 'time'])
@@ -147,35 +226,64 @@ def get_conn():
     return conn
 
 
-def insert_df(df, table_name, ignore=False):
+def insert_df(df, table_name, ignore=False, chunk_size=500):
     """
     Connects to and inserts a DataFrame into the database.
 
+    Rows are written with one multi-row INSERT and one commit per chunk. If a chunk fails it is
+    retried row by row so a single bad row doesn't drop the rest of its chunk.
+
     Args:
         df: The DataFrame to insert.
         table_name: The table to insert into.
         ignore: Whether to ignore existing records in table when inserting.
+        chunk_size: Number of rows written per INSERT statement and commit.
 
     """
 
     conn = get_conn()
-    cursor = conn.cursor(prepared=True)
+    cursor = conn.cursor()
     rows_affected = 0
+    rows_failed = 0
+    start = time.perf_counter()
+
+    query = (f'INSERT {"IGNORE " if ignore else ""}'
+             f'INTO {table_name}({", ".join(df.columns)}) '
+             f'VALUES({", ".join(["%s" for _ in df.columns])})')
+
+    rows = df.to_dict(orient='split')['data']
 
-    query = f'INSERT {"IGNORE " if ignore else ""}INTO {table_name}({", ".join(df.columns)}) VALUES({", ".join(["? " for _ in df.columns])})'
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
 
-    for x in df.to_dict(orient='split')['data']:
         try:
-            # Insert new data
-            cursor.execute(query, x)
+            # Insert new data as a single multi-row statement
+            with metrics.timer('db_insert_seconds'):
+                cursor.executemany(query, chunk)
+                conn.commit()
             rows_affected += cursor.rowcount
+
         except mysql.connector.Error as err:
+            conn.rollback()
+            logging.error(f'{table_name} : chunk starting at row {i} failed, retrying rows individually.')
             logging.error(err)
 
-    # Commit data to database
-    conn.commit()
+            for x in chunk:
+                try:
+                    cursor.execute(query, x)
+                    conn.commit()
+                    rows_affected += cursor.rowcount
+                except mysql.connector.Error as row_err:
+                    conn.rollback()
+                    rows_failed += 1
+                    logging.error(f'{table_name} : {row_err} {x}')
+
+    elapsed = time.perf_counter() - start
+    metrics.inc('rows_inserted', rows_affected)
+    metrics.inc('rows_failed', rows_failed)
 
-    logging.info(f'{table_name} : {rows_affected} rows successfully updated.')
+    logging.info(f'{table_name} : {rows_affected} rows successfully updated, {rows_failed} failed '
+                 f'({len(rows) / elapsed if elapsed else 0:.0f} rows/sec).')
 
     cursor.close()
     conn.close()
@@ -185,7 +293,8 @@ def main():
     logging.basicConfig(filename='lotto.log', level=logging.INFO, format='%(asctime)s : %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p')
     logging.info('Started Scraping...')
 
-    df = get_tickets_df()
+    cache = PageCache()
+    df = get_tickets_df_async(cache=cache)
 
     print(df)
 
@@ -198,6 +307,9 @@ def main():
     # Insert data into the prize table
     # insert_df(prize_df, 'prize')
 
+    cache.save()
+
+    metrics.write('scrape')
     logging.info('Finished.')
 
 
@@ -0,0 +1,245 @@
+import argparse
+import json
+import logging
+import numpy as np
+import pandas as pd
+import metrics
+import prize_parser
+from sqlalchemy import text
+from ticket_stats import get_engine
+
+# Number of simulated playing sessions per game
+TRIALS = 20000
+
+# Tickets bought in each session
+SESSION_TICKETS = 50
+
+# Dollars a player starts a session with, winnings are spent on more tickets
+BANKROLL = 100
+
+# Maximum number of ticket outcomes drawn at once across every game
+CHUNK_DRAWS = 2_000_000
+
+# Percentiles of the session return that are stored
+PERCENTILES = (5, 25, 50, 75, 95)
+
+SEED = 0
+
+
+def create_sim_table(sql_engine):
+    """
+    Creates the prize_sim table, holding the simulated outcomes of each game's latest prize snapshot.
+
+    Args:
+        sql_engine: Engine to use.
+
+    """
+
+    with sql_engine.begin() as db_connection:
+        db_connection.execute(text('CREATE TABLE IF NOT EXISTS prize_sim ('
+                                   'prize_id INT NOT NULL PRIMARY KEY, '
+                                   'ticket_number INT NOT NULL, '
+                                   'trials INT NOT NULL, '
+                                   'session_tickets INT NOT NULL, '
+                                   'bankroll DOUBLE NOT NULL, '
+                                   'mean_return DOUBLE NOT NULL, '
+                                   + ''.join(f'p{q}_return DOUBLE NOT NULL, ' for q in PERCENTILES) +
+                                   'p_profit DOUBLE NOT NULL, '
+                                   'risk_of_ruin DOUBLE NOT NULL, '
+                                   'p_top_prize DOUBLE NOT NULL, '
+                                   'INDEX prize_sim_ticket (ticket_number))'))
+
+
+def get_df(sql_engine):
+    """
+    Gets the latest prize snapshot of every game that still has prizes remaining.
+
+    Args:
+        sql_engine: Engine to use.
+
+    Returns:
+        A DataFrame with prize_id, ticket_number, price, odds and prize columns.
+
+    """
+
+    with sql_engine.connect() as db_connection:
+        df = pd.read_sql(text('SELECT p.prize_id, p.ticket_number, t.price, t.odds, p.prize FROM prize p '
+                              'JOIN (SELECT MAX(prize_id) AS prize_id FROM prize GROUP BY ticket_number) latest '
+                              'ON p.prize_id = latest.prize_id '
+                              'JOIN ticket t ON t.ticket_number = p.ticket_number'), db_connection)
+
+    return df.drop_duplicates('prize_id').reset_index(drop=True)
+
+
+def get_outcomes(df):
+    """
+    Builds each game's distribution of ticket outcomes, a loss followed by one outcome per prize tier.
+
+    A ticket wins with probability 1 / odds, and a winning ticket hits each tier in proportion to its prizes
+    remaining.
+
+    Args:
+        df: DataFrame with price, odds and prize columns.
+
+    Returns:
+        A tuple of the flattened outcome payouts, the flattened CDF offset by the game's index so every game's CDF
+        runs from its index to its index + 1, where each active game's losing outcome ends in the CDF, each game's
+        probability of hitting its top prize, and a mask of the games that have prizes remaining.
+
+    """
+
+    prize_tables = [json.loads(prize) for prize in df['prize']]
+    odds = df['odds'].to_numpy(dtype=float)
+
+    # If no odds are found use default value, as the ev_score does
+    p_win = 1 / np.where(odds > 0, odds, 4)
+
+    payouts = []
+    cdf = []
+    lose_edge = []
+    p_top = np.zeros(len(df))
+    active = np.zeros(len(df), dtype=bool)
+
+    for game, table in enumerate(prize_tables):
+        remaining = np.array([int(rem.replace(',', '')) for rem in table.values()], dtype=float)
+        total = remaining.sum()
+
+        if total <= 0:
+            continue
+
+        active[game] = True
+        probabilities = np.concatenate(([1 - p_win[game]], p_win[game] * remaining / total))
+        p_top[game] = probabilities[1]
+
+        payouts.append(np.concatenate(([0.0], prize_parser.parse_prize_amounts(list(table.keys())))))
+        cdf.append(game + np.minimum(np.cumsum(probabilities), 1))
+
+        # Rounding can leave the last cumulative probability just short of the next game's start
+        cdf[-1][-1] = game + 1
+        lose_edge.append(cdf[-1][0])
+
+    if not payouts:
+        return np.zeros(0), np.zeros(0), np.zeros(0), p_top, active
+
+    return np.concatenate(payouts), np.concatenate(cdf), np.array(lose_edge), p_top, active
+
+
+def simulate(df, trials=TRIALS, session_tickets=SESSION_TICKETS, bankroll=BANKROLL, chunk_draws=CHUNK_DRAWS, seed=SEED):
+    """
+    Simulates playing sessions of every game at once.
+
+    Outcomes are drawn for all games in one pass: each draw is a uniform number offset by its game's index and
+    looked up in the flattened CDF of every game's outcomes. Sessions are drawn in chunks so memory stays bounded.
+
+    Args:
+        df: DataFrame with prize_id, ticket_number, price, odds and prize columns.
+        trials: Number of sessions simulated per game.
+        session_tickets: Tickets bought in each session.
+        bankroll: Dollars a player starts a session with, used for the risk of ruin.
+        chunk_draws: Maximum number of ticket outcomes drawn at once.
+        seed: Seed of the random generator, the same seed gives the same results.
+
+    Returns:
+        A DataFrame with the columns of the prize_sim table, one row per game with prizes remaining.
+
+    """
+
+    payouts, cdf, lose_edge, p_top, active = get_outcomes(df)
+    games = np.flatnonzero(active)
+    price = df['price'].to_numpy(dtype=float)[games]
+
+    rng = np.random.default_rng(seed)
+    returns = np.empty((len(games), trials), dtype=np.float32)
+    ruined = np.zeros(len(games), dtype=np.int64)
+
+    chunk = max(1, chunk_draws // max(1, len(games) * session_tickets))
+
+    for start in range(0, trials, chunk):
+        sessions = min(chunk, trials - start)
+
+        # Uniform draws shifted into each game's slice of the flattened CDF
+        draws = rng.random((len(games), sessions, session_tickets))
+        draws += games[:, None, None]
+
+        # Most tickets lose, only the winning draws need a search for their tier
+        won = draws >= lose_edge[:, None, None]
+        winnings = np.zeros(draws.shape)
+        winnings[won] = payouts[np.minimum(np.searchsorted(cdf, draws[won], side='right'), len(payouts) - 1)]
+
+        returns[:, start:start + sessions] = winnings.sum(axis=2) / (price * session_tickets)[:, None] - 1
+
+        # Cash on hand before each ticket, the player is ruined once they can't afford the next one
+        winnings -= price[:, None, None]
+        lowest = np.cumsum(winnings, axis=2)[:, :, :-1].min(axis=2, initial=0)
+        ruined += (bankroll + lowest < price[:, None]).sum(axis=1)
+
+    sim_df = pd.DataFrame({
+        'prize_id': df['prize_id'].to_numpy()[games],
+        'ticket_number': df['ticket_number'].to_numpy()[games],
+        'trials': trials,
+        'session_tickets': session_tickets,
+        'bankroll': float(bankroll),
+        'mean_return': returns.mean(axis=1, dtype=np.float64),
+    })
+
+    for q, values in zip(PERCENTILES, np.percentile(returns, PERCENTILES, axis=1)):
+        sim_df[f'p{q}_return'] = values
+
+    sim_df['p_profit'] = (returns > 0).mean(axis=1)
+    sim_df['risk_of_ruin'] = ruined / trials
+
+    # Chance of at least one top prize in a session, exact rather than simulated since it is tiny
+    sim_df['p_top_prize'] = 1 - (1 - p_top[games]) ** session_tickets
+
+    return sim_df
+
+
+def update_sims(sql_engine, **kwargs):
+    """
+    Simulates every active game's latest prize snapshot and replaces the stored simulations.
+
+    Args:
+        sql_engine: Engine to use.
+        **kwargs: Passed to simulate.
+
+    Returns:
+        The number of games simulated.
+
+    """
+
+    create_sim_table(sql_engine)
+    df = get_df(sql_engine)
+
+    with metrics.timer('sim_seconds'):
+        sim_df = simulate(df, **kwargs)
+
+    with sql_engine.begin() as db_connection:
+        db_connection.execute(text('DELETE FROM prize_sim'))
+        sim_df.to_sql('prize_sim', db_connection, if_exists='append', index=False)
+
+    metrics.inc('games_simulated', len(sim_df))
+    logging.info(f'prize_sim : {len(sim_df)} games simulated.')
+
+    return len(sim_df)
+
+
+def main(trials=TRIALS, session_tickets=SESSION_TICKETS, bankroll=BANKROLL, seed=SEED):
+    logging.basicConfig(filename='lotto_stats.log', level=logging.INFO, format='%(asctime)s : %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p')
+    logging.info('Started Ticket Simulation...')
+
+    update_sims(get_engine(), trials=trials, session_tickets=session_tickets, bankroll=bankroll, seed=seed)
+
+    metrics.write('sim')
+    logging.info('Finished Ticket Simulation.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulates playing sessions of every game with prizes remaining.')
+    parser.add_argument('--trials', type=int, default=TRIALS, help='sessions simulated per game')
+    parser.add_argument('--tickets', type=int, default=SESSION_TICKETS, help='tickets bought per session')
+    parser.add_argument('--bankroll', type=float, default=BANKROLL, help='dollars a session starts with')
+    parser.add_argument('--seed', type=int, default=SEED, help='seed of the random generator')
+    args = parser.parse_args()
+
+    main(args.trials, args.tickets, args.bankroll, args.seed)
@@ -1,9 +1,26 @@
+import argparse
 import logging
 import os
+from contextlib import nullcontext
 import pandas as pd
 import json
 import numpy as np
-from sqlalchemy import create_engine
+import prize_parser
+import metrics
+import read_cache
+from sqlalchemy import create_engine, text
+
+# Name of the high-water mark tracking the last prize_id processed into prize_stats
+WATERMARK = 'prize_stats'
+
+# Number of prize rows processed per batch
+BATCH_SIZE = 5000
+
+# Name of the running bounds ev_score is normalized against
+EV_BOUNDS = 'ev_score'
+
+# Normalized ev_score of every row while all raw estimated values are equal
+EV_SCORE_FLAT = 5.5
 
 
 def get_engine():
@@ -15,241 +32,496 @@ def get_engine():
     return create_engine(f'mysql+pymysql://{user}:{password}@{host}/{database}', pool_recycle=3600)
 
 
-def get_df():
+def get_df(after_id=0, batch_size=BATCH_SIZE, sql_engine=None):
     """
-    Gets a DataFrame containing the rows from the prize table that don't exist in prize_stats.
+    Gets a DataFrame containing the next batch of rows from the prize table past the high-water mark.
+
+    Args:
+        after_id: Only rows with a greater prize_id are returned.
+        batch_size: Maximum number of rows to return.
+        sql_engine: Engine to use. A new engine is created if none is given.
 
     Returns:
-        A DataFrame containing rows that exist in prize but not prize_stats.
+        A DataFrame containing rows that exist in prize but not prize_stats, ordered by prize_id.
 
     """
 
-    sql_engine = get_engine()
+    sql_engine = sql_engine or get_engine()
     db_connection = sql_engine.connect()
 
-    df = pd.read_sql('SELECT DISTINCT price, odds, prize, prize_id FROM prize NATURAL JOIN ticket WHERE prize_id NOT IN (SELECT prize_id FROM prize_stats)', db_connection)
+    df = pd.read_sql(text('SELECT DISTINCT price, odds, prize, prize_id FROM prize NATURAL JOIN ticket '
+                          'WHERE prize_id > :after_id ORDER BY prize_id LIMIT :batch_size'),
+                     db_connection, params={'after_id': int(after_id), 'batch_size': int(batch_size)})
     db_connection.close()
 
     return df
 
 
-def get_prize_stats_df(df):
+def get_watermark(sql_engine, name=WATERMARK):
+    """
+    Gets the persisted high-water mark, creating the watermark table on first use.
+
+    The first time a watermark is read it starts from the last prize_id already in prize_stats.
+
+    Args:
+        sql_engine: Engine to use.
+        name: Name of the watermark.
+
+    Returns:
+        The last prize_id that was processed.
+
+    """
+
+    with sql_engine.begin() as db_connection:
+        db_connection.execute(text('CREATE TABLE IF NOT EXISTS stats_watermark ('
+                                   'name VARCHAR(64) PRIMARY KEY, last_id BIGINT NOT NULL)'))
+
+        last_id = db_connection.execute(text('SELECT last_id FROM stats_watermark WHERE name = :name'),
+                                        {'name': name}).scalar()
+
+        if last_id is None:
+            last_id = db_connection.execute(text('SELECT COALESCE(MAX(prize_id), 0) FROM prize_stats')).scalar()
+
+    return int(last_id)
+
+
+def set_watermark(sql_engine, last_id, name=WATERMARK, db_connection=None):
+    """
+    Persists the high-water mark.
+
+    Args:
+        sql_engine: Engine to use.
+        last_id: The last prize_id that was processed.
+        name: Name of the watermark.
+        db_connection: Optional connection of an open transaction to write the mark in, so it commits together
+            with the rows it covers.
+
+    """
+
+    # Replaced within one transaction rather than upserted, so the same SQL runs on SQLite in the benchmark
+    with nullcontext(db_connection) if db_connection is not None else sql_engine.begin() as db_connection:
+        db_connection.execute(text('DELETE FROM stats_watermark WHERE name = :name'), {'name': name})
+        db_connection.execute(text('INSERT INTO stats_watermark (name, last_id) VALUES (:name, :last_id)'),
+                              {'name': name, 'last_id': int(last_id)})
+
+
+def reset_stats(sql_engine, name=WATERMARK):
+    """
+    Deletes every row from prize_stats, the ev_score bounds and rewinds the high-water mark so all prize rows are
+    processed again.
+
+    Args:
+        sql_engine: Engine to use.
+        name: Name of the watermark.
+
+    """
+
+    # Both reads create their table if it doesn't exist yet
+    get_watermark(sql_engine, name)
+    get_ev_bounds(sql_engine)
+
+    with sql_engine.begin() as db_connection:
+        db_connection.execute(text('DELETE FROM prize_stats'))
+        db_connection.execute(text('DELETE FROM ev_bounds WHERE name = :name'), {'name': EV_BOUNDS})
+        set_watermark(sql_engine, 0, name, db_connection)
+
+    logging.info('Cleared prize_stats for a full rebuild.')
+
+
+def get_prize_stats_df(df, bounds=None):
     """
     Takes a DataFrame with prize values and returns a new DataFrame with various calculated values.
 
+    Every prize table is exploded into one long array of (row, tier, remaining) entries so the stats for all
+    rows are computed with a handful of grouped NumPy operations.
+
     Args:
         df: A DataFrame containing rows that exist in prize but not prize_stats.
+        bounds: The (min, max) raw estimated value seen so far, widened by this batch's values before ev_score is
+            normalized against it.
 
     Returns:
         A new DataFrame that contains various calculated values from the prize data.
 
     """
 
-    # Convert prizes to list
-    prize_list = df[['prize', 'prize_id', 'price', 'odds']].values.tolist()
+    # Use price and odds for estimated value
+    price = df['price'].to_numpy(dtype=float)
+    odds = df['odds'].to_numpy(dtype=float)
+
+    # Convert to JSON
+    prize_tables = [json.loads(prize) for prize in df['prize']]
+
+    # Number of tiers in each row and the position of each row's first tier
+    tier_counts = np.fromiter((len(table) for table in prize_tables), dtype=np.int64, count=len(prize_tables))
+    tier_starts = np.cumsum(tier_counts) - tier_counts
+    tier_rows = np.repeat(np.arange(len(prize_tables)), tier_counts)
+
+    # Prize amounts and prizes remaining for every tier of every row
+    prize_amounts = [amt for table in prize_tables for amt in table.keys()]
+    prizes_remaining = np.array([int(rem.replace(',', '')) for table in prize_tables for rem in table.values()],
+                                dtype=np.int64)
+
+    # Calculate the sum of remaining prizes
+    total_prizes_rem = np.bincount(tier_rows, weights=prizes_remaining, minlength=len(df)).astype(np.int64)
+
+    # The top prize is the first tier of each row
+    top_prizes_rem = np.zeros(len(df), dtype=np.int64)
+    has_tiers = tier_counts > 0
+    top_prizes_rem[has_tiers] = prizes_remaining[tier_starts[has_tiers]]
+
+    # Calculate the estimated value of a ticket
+    ev_raw = get_ev_scores(prize_amounts, prizes_remaining, tier_rows, total_prizes_rem, price, odds)
+
+    prize_stats_df = pd.DataFrame({
+        'prize_id': df['prize_id'].to_numpy(),
+        'total_prizes_rem': total_prizes_rem,
+        'top_prizes_rem': top_prizes_rem,
+        'ev_raw': ev_raw,
+        'ev_score': normalize_ev(ev_raw, extend_bounds(bounds, ev_raw)),
+    })
+
+    return prize_stats_df
+
+
+def extend_bounds(bounds, ev_raw):
+    """
+    Widens the running (min, max) raw estimated value to include new values.
+
+    Args:
+        bounds: The (min, max) seen so far, or None.
+        ev_raw: Array of new raw estimated values.
 
-    # Used to store all tickets stats
-    prize_stats_df = []
+    Returns:
+        The new (min, max), or bounds if there are no new values.
 
-    for prize in prize_list:
-        # Convert to JSON
-        prize_json = json.loads(prize[0])
+    """
 
-        # Keep prize_id to maintain index
-        prize_id = prize[1]
+    ev_raw = np.asarray(ev_raw, dtype=float)
+    ev_raw = ev_raw[np.isfinite(ev_raw)]
 
-        # Use price and odds for estimated value
-        price = prize[2]
-        odds = float(prize[3])
+    if not len(ev_raw):
+        return bounds
 
-        # Create Series for prize amounts and prizes remaining
-        prize_amounts = pd.Series(prize_json.keys())
-        prizes_remaining = pd.Series(prize_json.values())
+    if bounds is None:
+        return float(ev_raw.min()), float(ev_raw.max())
 
-        # Remove commas and cast as int
-        prizes_remaining = prizes_remaining.str.replace(',', '').astype(int)
+    return min(bounds[0], float(ev_raw.min())), max(bounds[1], float(ev_raw.max()))
 
-        top_prizes_remaining = prizes_remaining[0]
 
-        # Combine prize amounts and prizes remaining into dict
-        prize_data = {
-            'Prize Amt': prize_amounts,
-            'Prizes Rem': prizes_remaining,
-        }
+def normalize_ev(ev_raw, bounds):
+    """
+    Scales raw estimated values to an ev_score between 1 and 10.
 
-        # Create DataFrame from prize data
-        prize_df = pd.DataFrame(prize_data)
+    Args:
+        ev_raw: Array of raw estimated values.
+        bounds: The (min, max) raw estimated value to scale against.
 
-        # Calculate the sum of remaining prizes
-        total_prizes_rem = prize_df.iloc[:, 1].sum()
+    Returns:
+        An array of ev_scores, EV_SCORE_FLAT for every value while the bounds are equal.
 
-        # Calculate the estimated value of a ticket
-        ev_score = get_ev_score(prize_amounts, prizes_remaining, price, odds)
+    """
 
-        prize_stats = {
-            'prize_id': prize_id,
-            'total_prizes_rem': total_prizes_rem,
-            'top_prizes_rem': top_prizes_remaining,
-            'ev_score': ev_score,
-        }
+    ev_raw = np.asarray(ev_raw, dtype=float)
 
-        prize_stats_df.append(prize_stats)
+    if bounds is None or bounds[1] <= bounds[0]:
+        return np.full(len(ev_raw), EV_SCORE_FLAT)
 
-    # Convert data into DataFrame and add id column to beginning
-    prize_stats_df = pd.DataFrame(prize_stats_df)
+    return (ev_raw - bounds[0]) / (bounds[1] - bounds[0]) * 9 + 1
 
-    # Normalize ev_score to values between 1 and 10
-    prize_stats_df['ev_score'] = (prize_stats_df['ev_score'] - prize_stats_df['ev_score'].min()) / np.ptp(prize_stats_df['ev_score']) * 9 + 1
 
-    return prize_stats_df
+def get_ev_bounds(sql_engine, name=EV_BOUNDS):
+    """
+    Gets the persisted running bounds of the raw estimated value, creating the bounds table on first use.
+
+    Args:
+        sql_engine: Engine to use.
+        name: Name of the bounds.
+
+    Returns:
+        The (min, max) raw estimated value, or None if no stats were calculated yet.
+
+    """
+
+    with sql_engine.begin() as db_connection:
+        db_connection.execute(text('CREATE TABLE IF NOT EXISTS ev_bounds ('
+                                   'name VARCHAR(64) PRIMARY KEY, ev_min DOUBLE NOT NULL, ev_max DOUBLE NOT NULL)'))
+
+        row = db_connection.execute(text('SELECT ev_min, ev_max FROM ev_bounds WHERE name = :name'),
+                                    {'name': name}).first()
+
+    return (row[0], row[1]) if row else None
+
+
+def rescale_ev_scores(db_connection, bounds, name=EV_BOUNDS):
+    """
+    Persists new bounds and rescales every stored ev_score against them with a single UPDATE.
+
+    Args:
+        db_connection: Connection of the open transaction to write in.
+        bounds: The new (min, max) raw estimated value.
+        name: Name of the bounds.
+
+    """
+
+    ev_min, ev_max = bounds
+
+    db_connection.execute(text('DELETE FROM ev_bounds WHERE name = :name'), {'name': name})
+    db_connection.execute(text('INSERT INTO ev_bounds (name, ev_min, ev_max) VALUES (:name, :ev_min, :ev_max)'),
+                          {'name': name, 'ev_min': ev_min, 'ev_max': ev_max})
+
+    if ev_max > ev_min:
+        db_connection.execute(text('UPDATE prize_stats SET ev_score = (ev_raw - :ev_min) / :ptp * 9 + 1'),
+                              {'ev_min': ev_min, 'ptp': ev_max - ev_min})
+    else:
+        db_connection.execute(text('UPDATE prize_stats SET ev_score = :flat'), {'flat': EV_SCORE_FLAT})
+
+    logging.info(f'ev_score bounds moved to [{ev_min:.4f}, {ev_max:.4f}], stored scores rescaled.')
+
+
+def normalize_stored_ev(sql_engine, name=EV_BOUNDS):
+    """
+    Sets the bounds to the min and max ev_raw in prize_stats and rescales every stored ev_score once, after a run
+    that started without persisted bounds.
+
+    Args:
+        sql_engine: Engine to use.
+        name: Name of the bounds.
+
+    """
+
+    with sql_engine.begin() as db_connection:
+        ev_min, ev_max = db_connection.execute(text('SELECT MIN(ev_raw), MAX(ev_raw) FROM prize_stats')).first()
 
+        if ev_min is not None:
+            rescale_ev_scores(db_connection, (ev_min, ev_max), name)
 
-def get_ev_score(prize_amounts, prizes_remaining, price, odds):
+
+def get_ev_scores(prize_amounts, prizes_remaining, tier_rows, total_prizes_rem, price, odds):
     """
-    Gets an estimated value score based on the ticket's price, odds, and prizes remaining.
+    Gets the estimated value score of many tickets at once.
 
     Args:
-        prize_amounts: Series containing prize amounts.
-        prizes_remaining: Series containing prizes remaining.
-        price: Ticket's price.
-        odds: Ticket's odds of winning.
+        prize_amounts: Prize amount label of every tier of every ticket.
+        prizes_remaining: Array of prizes remaining for every tier of every ticket.
+        tier_rows: Array with the index of the ticket each tier belongs to.
+        total_prizes_rem: Array of the total prizes remaining of each ticket.
+        price: Array of each ticket's price.
+        odds: Array of each ticket's odds of winning.
 
     Returns:
-        A calculated estimated value score.
-
-    """
-
-    new_prize_amounts = []
-
-    for amt in prize_amounts:
-        try:
-            amt = amt.replace(',', '')
-            amt = amt.replace('$', '')
-            amt = pd.to_numeric(amt)
-        except ValueError:
-            amt = amt.upper()
-
-            if '&' in amt:
-                # ex. TPD ENTRY & 5500 Tax Free, TPD ENTRY & 5500
-                amt = amt.split(' ')
-                amt = amt[3]
-                amt = pd.to_numeric(amt)
-
-            elif 'TPD' in amt or 'MEGAPLIER' in amt or 'ENTRY' in amt or 'DRAWING' in amt:
-                # ex. 250K/YR FOR LIFE/TPD, top prize drawing, not counted as a prize
-                amt = 0
-
-            elif 'LIFE' in amt:
-                # ex. 250K/YR FOR LIFE
-                amt = amt.split()
-                amt = amt[0].split('/')[0].strip("K")
-                amt = pd.to_numeric(amt)
-
-                # 20 years worth of prizes
-                amt = amt * 1000 * 20
-
-            elif 'FOR' in amt:
-                # ex. 2500/MO FOR 10YRS
-                amt = (amt.split('FOR'))
-
-                # 10YRS
-                time = amt[1].split()[0]
-                time = pd.to_numeric(time)
-
-                # 2500
-                val = amt[0].split('/')[0]
-                # MO
-                period = amt[0].split('/')[1]
-
-                if 'K' in val:
-                    val = val.strip("K")
-                    val = pd.to_numeric(val)
-                    val *= 1000
-                else:
-                    val = pd.to_numeric(val)
-
-                # Change val to represent the amount for one year
-                if 'MO' in period:
-                    val = pd.to_numeric(val)
-                    val *= 12
-
-                amt = val * time
-
-            elif '(' in amt and ')' in amt:
-                # ex. 1000000(40K/YR/25YRS)
-                amt = amt.split('(')
-                amt = amt[0]
-                amt = pd.to_numeric(amt)
-
-            else:
-                logging.info(f'Value Error while transforming prize amounts. {amt}')
-                amt = 0
-
-        finally:
-            new_prize_amounts.append(amt)
-
-    # Create DataFrame to calculate expected value
-    ev = pd.DataFrame(columns=['prize', 'rem', 'x', 'p(x)', 'x * p(x)'])
-    ev['prize'] = new_prize_amounts
-    ev['rem'] = prizes_remaining
-    ev['x'] = ev['prize'] - price
-    ev['x'] = ev['x'].clip(0)  # set all negative values to 0
-    ev['p(x)'] = ev['rem'] / ev['rem'].sum()
-    ev['x * p(x)'] = ev['x'] * ev['p(x)']
-
-    expected = ev['x * p(x)'].sum()
+        An array of calculated estimated value scores.
+
+    """
+
+    # Parse each distinct prize label once
+    amounts = prize_parser.parse_prize_amounts(prize_amounts)
+
+    # Set all negative values to 0
+    x = np.clip(amounts - price[tier_rows], 0, None)
+
+    # Probability of each tier, tickets without any prizes remaining have an expected value of 0
+    tier_totals = total_prizes_rem[tier_rows]
+    p_x = np.divide(prizes_remaining, tier_totals, out=np.zeros(len(tier_rows)), where=tier_totals > 0)
+
+    expected = np.bincount(tier_rows, weights=x * p_x, minlength=len(price))
 
     # If no odds are found use default value
-    if odds == 0:
-        odds = 4
+    odds = np.where(odds == 0, 4, odds)
 
     # The average return from each ticket
-    ev_score = ((expected / odds) - price) / price
+    return ((expected / odds) - price) / price
+
+
+def get_prize_ids(after_id, sql_engine):
+    """
+    Gets the keys of every prize row past the high-water mark and their ticket's stored price and odds, without the
+    prize tables themselves.
 
-    return ev_score
+    Args:
+        after_id: Only rows with a greater prize_id are returned.
+        sql_engine: Engine to use.
+
+    Returns:
+        A DataFrame with prize_id, ticket_number, time, price and odds columns.
+
+    """
 
+    with sql_engine.connect() as db_connection:
+        df = pd.read_sql(text('SELECT DISTINCT prize_id, ticket_number, time, price, odds '
+                              'FROM prize NATURAL JOIN ticket WHERE prize_id > :after_id'),
+                         db_connection, params={'after_id': int(after_id)})
 
-def insert_df(df, table_name):
+    return df.drop_duplicates('prize_id')
+
+
+def match_prize_ids(snapshot_df, after_id, sql_engine):
     """
-    Connects to and inserts a DataFrame into the database.
+    Matches prize snapshots the scraper just wrote to their prize_id with one lookup query. Price and odds are read
+    from the stored ticket rows, as get_df does.
 
     Args:
-        df: The DataFrame to insert.
-        table_name: The table to insert into.
+        snapshot_df: DataFrame with ticket_number, prize and time columns.
+        after_id: The high-water mark.
+        sql_engine: Engine to use.
+
+    Returns:
+        A DataFrame like get_df returns, or None if some prize rows past the high-water mark are not in snapshot_df.
+
+    """
+
+    ids = get_prize_ids(after_id, sql_engine)
+    ids['time'] = pd.to_datetime(ids['time'])
+
+    # Snapshots that can't be parsed are left out, their prize rows are then read from the database
+    snapshots = pd.DataFrame({
+        'ticket_number': pd.to_numeric(snapshot_df['ticket_number'], errors='coerce'),
+        'time': pd.to_datetime(snapshot_df['time'], errors='coerce'),
+        'prize': snapshot_df['prize'],
+    }).dropna().drop_duplicates(['ticket_number', 'time'])
+
+    df = ids.merge(snapshots, on=['ticket_number', 'time'], how='left')
+
+    if df['prize'].isna().any():
+        return None
 
+    return df.sort_values('prize_id')[['price', 'odds', 'prize', 'prize_id']].reset_index(drop=True)
+
+
+def store_stats(prize_stats_df, last_id, sql_engine, bounds=None):
     """
+    Inserts a batch of stats and advances the high-water mark past it in one transaction, so a crash can't leave
+    stored rows behind the mark.
+
+    Args:
+        prize_stats_df: The stats to insert.
+        last_id: The last prize_id of the batch.
+        sql_engine: Engine to use.
+        bounds: New (min, max) raw estimated value the batch moved the bounds to. The stored scores are rescaled
+            against it in the same transaction, so readers never see them on different scales.
+
+    Returns:
+        True if the batch was stored.
 
-    sql_engine = get_engine()
-    db_conn = sql_engine.connect()
+    """
 
     try:
-        df.to_sql(table_name, db_conn, if_exists='append', index=False)
-    except ValueError as vx:
-        logging.error(vx)
+        with sql_engine.begin() as db_connection:
+            if bounds is not None:
+                rescale_ev_scores(db_connection, bounds)
+
+            with metrics.timer('db_insert_seconds'):
+                prize_stats_df.to_sql('prize_stats', db_connection, if_exists='append', index=False)
+
+            set_watermark(sql_engine, last_id, db_connection=db_connection)
+
     except Exception as ex:
         logging.exception(ex)
-    else:
-        logging.info(f"Table {table_name} successfully updated.")
-    finally:
-        db_conn.close()
+        return False
 
+    metrics.inc('rows_inserted', len(prize_stats_df))
+    logging.info("Table prize_stats successfully updated.")
 
-def main():
-    logging.basicConfig(filename='lotto_stats.log', level=logging.INFO, format='%(asctime)s : %(message)s',
-                        datefmt='%m/%d/%Y %I:%M:%S %p')
-    logging.info('Started Ticket Stats...')
+    return True
+
+
+def update_stats(sql_engine, snapshot_df=None, rebuild=False, batch_size=BATCH_SIZE):
+    """
+    Calculates stats for every prize row past the high-water mark, advancing the mark after each stored batch.
+
+    Args:
+        sql_engine: Engine to use.
+        snapshot_df: Optional prize snapshots the scraper just wrote. If they cover every new prize row, their stats
+            are calculated from memory instead of reading the prize tables back from the database.
+        rebuild: Whether to recalculate stats for every prize row.
+        batch_size: Number of prize rows read from the database per batch.
+
+    Returns:
+        The number of prize rows processed.
+
+    """
+
+    if rebuild:
+        reset_stats(sql_engine)
+
+    last_id = get_watermark(sql_engine)
+    bounds = get_ev_bounds(sql_engine)
+    rows_processed = 0
 
-    df = get_df()
+    # Without persisted bounds, ex. on a rebuild, the bounds move on most batches. Rescaling the stored scores each
+    # time would cost a full table UPDATE per batch, so they are rescaled once at the end instead
+    deferred = bounds is None
+    pending = None
 
-    if not df.empty:
-        prize_stats_df = get_prize_stats_df(df)
-        insert_df(prize_stats_df, 'prize_stats')
+    if snapshot_df is not None and not rebuild:
+        pending = match_prize_ids(snapshot_df, last_id, sql_engine)
+
+        if pending is None:
+            logging.info('New prize rows were not all written by this scrape, reading them from the database.')
+
+    # Process new prize rows in batches, advancing the watermark after each batch is stored
+    while True:
+        from_memory = pending is not None
+        df = pending if from_memory else get_df(last_id, batch_size, sql_engine)
+        pending = None
+
+        if df.empty:
+            break
+
+        with metrics.timer('stats_seconds'):
+            prize_stats_df = get_prize_stats_df(df, bounds)
+        metrics.inc('prize_rows_processed', len(df))
+
+        # Stored scores only need rescaling when this batch moved the bounds
+        new_bounds = extend_bounds(bounds, prize_stats_df['ev_raw'])
+        moved = new_bounds != bounds and not deferred
+
+        if not store_stats(prize_stats_df, df['prize_id'].max(), sql_engine, new_bounds if moved else None):
+            logging.error(f'Stopped at prize_id {last_id}, the next run resumes from there.')
+            break
+
+        bounds = new_bounds
+
+        last_id = df['prize_id'].max()
+        rows_processed += len(df)
+
+        # The scraped snapshots were every row past the watermark
+        if from_memory:
+            break
+
+    # Also covers rows stored by an earlier run that stopped before its rescale
+    if deferred:
+        normalize_stored_ev(sql_engine)
+
+    if rows_processed:
+        # Let the API drop its cached rankings
+        read_cache.invalidate()
+
+        parser_cache = prize_parser.cache_info()
+        logging.info(f'{rows_processed} prize rows processed up to prize_id {last_id}.')
+        logging.info(f'Prize label cache: {parser_cache.hits} hits, {parser_cache.misses} misses.')
 
     else:
         logging.info("No new rows to insert.")
 
+    return rows_processed
+
+
+def main(rebuild=False, batch_size=BATCH_SIZE):
+    logging.basicConfig(filename='lotto_stats.log', level=logging.INFO, format='%(asctime)s : %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p')
+    logging.info('Started Ticket Stats...')
+
+    update_stats(get_engine(), rebuild=rebuild, batch_size=batch_size)
+
+    metrics.write('stats')
     logging.info('Finished Ticket Stats.')
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Calculates stats for new prize rows.')
+    parser.add_argument('--rebuild', action='store_true', help='recalculate stats for every prize row')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='prize rows processed per batch')
+    args = parser.parse_args()
+
+    main(args.rebuild, args.batch_size)